@@ -1,5 +1,6 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
+from .geocoding import get_cache_stats
 from .models import Address
 
 
@@ -10,3 +11,12 @@ class AddressAdmin(admin.ModelAdmin):
         'longitude',
         'latitude',
     ]
+
+    def changelist_view(self, request, extra_context=None):
+        stats = get_cache_stats()
+        if stats:
+            summary = ', '.join(
+                f'{event}: {number}' for event, number in sorted(stats.items())
+            )
+            messages.info(request, f'Кэш геокодера: {summary}')
+        return super().changelist_view(request, extra_context)
@@ -1,14 +1,101 @@
+import threading
+import time
+
+from django.conf import settings
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GEOCODER_URL = 'https://geocode-maps.yandex.ru/1.x'
+
+
+class GeocoderUnavailable(requests.exceptions.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise GeocoderUnavailable('Геокодер временно недоступен')
+            # Пропускаем один пробный запрос, остальные ждут его результата
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+_session = None
+_session_lock = threading.Lock()
+_breaker = None
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=settings.GEOCODER_RETRIES,
+                backoff_factor=settings.GEOCODER_RETRY_BACKOFF,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['GET'],
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.GEOCODER_WORKERS,
+                max_retries=retry,
+            )
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+        return _session
+
+
+def get_circuit_breaker():
+    global _breaker
+    with _session_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(
+                settings.GEOCODER_BREAKER_THRESHOLD,
+                settings.GEOCODER_BREAKER_TIMEOUT,
+            )
+        return _breaker
 
 
 def fetch_coordinates(apikey, address):
-    base_url = 'https://geocode-maps.yandex.ru/1.x'
-    response = requests.get(base_url, params={
-        'geocode': address,
-        'apikey': apikey,
-        'format': 'json',
-    })
-    response.raise_for_status()
+    breaker = get_circuit_breaker()
+    breaker.before_call()
+    try:
+        response = get_session().get(GEOCODER_URL, params={
+            'geocode': address,
+            'apikey': apikey,
+            'format': 'json',
+        }, timeout=(
+            settings.GEOCODER_CONNECT_TIMEOUT,
+            settings.GEOCODER_READ_TIMEOUT,
+        ))
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+
     found_places = response.json()['response']['GeoObjectCollection']['featureMember']
 
     if not found_places:
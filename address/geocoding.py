@@ -0,0 +1,227 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+import requests
+
+from .coordinates import fetch_coordinates
+from .models import Address, normalize_address
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def count(event, number=1):
+    with _stats_lock:
+        _stats[event] += number
+
+
+def get_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+class GeocodeCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, address):
+        with self.lock:
+            entry = self.entries.get(address)
+            if entry is None:
+                return None
+            coordinates, expires_at = entry
+            if expires_at <= timezone.now():
+                del self.entries[address]
+                return None
+            self.entries.move_to_end(address)
+            return entry
+
+    def set(self, address, coordinates, expires_at):
+        with self.lock:
+            self.entries[address] = (coordinates, expires_at)
+            self.entries.move_to_end(address)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+memory_cache = GeocodeCache(settings.GEOCODER_CACHE_SIZE)
+
+
+def lookup_coordinates(address):
+    count('upstream_requests')
+    try:
+        coordinates = fetch_coordinates(settings.YANDEX_GEO_APIKEY, address)
+    except (requests.exceptions.RequestException, KeyError):
+        count('upstream_failures')
+        return None
+    if not coordinates:
+        count('upstream_not_found')
+        return None
+    lat, lon = coordinates
+    return float(lat), float(lon)
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_call = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def fetch_many(addresses, workers=None, rate_limiter=None):
+    def lookup(address):
+        if rate_limiter:
+            rate_limiter.wait()
+        return lookup_coordinates(address)
+
+    addresses = list(set(addresses))
+    if len(addresses) <= 1:
+        return {address: lookup(address) for address in addresses}
+    with ThreadPoolExecutor(workers or settings.GEOCODER_WORKERS) as executor:
+        found_coordinates = executor.map(lookup, addresses)
+        return dict(zip(addresses, found_coordinates))
+
+
+def save_lookups(records, found_coordinates):
+    coordinates_by_address = {}
+    new_records = []
+    updated_records = []
+    now = timezone.now()
+    for address, coordinates in found_coordinates.items():
+        record = records.get(address)
+        if not coordinates and record and record.coordinates():
+            # Геокодер не ответил, отдаём устаревшие координаты
+            stale_coordinates = record.coordinates()
+            memory_cache.set(
+                address,
+                stale_coordinates,
+                now + timedelta(seconds=settings.GEOCODER_NEGATIVE_TTL),
+            )
+            coordinates_by_address[address] = stale_coordinates
+            continue
+
+        if record is None:
+            record = Address(address=address)
+            new_records.append(record)
+        else:
+            updated_records.append(record)
+        if coordinates:
+            record.latitude, record.longitude = coordinates
+            record.update_geohash()
+        else:
+            record.attempts += 1
+        record.request_date = now
+        memory_cache.set(address, coordinates, record.expires_at())
+        coordinates_by_address[address] = coordinates
+
+    Address.objects.bulk_create(new_records, ignore_conflicts=True)
+    Address.objects.bulk_update(
+        updated_records,
+        ['latitude', 'longitude', 'geohash', 'request_date', 'attempts'],
+    )
+    return coordinates_by_address
+
+
+def get_many_coordinates(addresses, fetch=True, workers=None,
+                         rate_limiter=None):
+    normalized_addresses = {
+        address: normalize_address(address) for address in addresses
+    }
+
+    found_coordinates = {}
+    missing = set()
+    for address in set(normalized_addresses.values()):
+        if not address:
+            found_coordinates[address] = None
+            continue
+        entry = memory_cache.get(address)
+        if entry:
+            coordinates, expires_at = entry
+            count('memory_hits' if coordinates else 'negative_hits')
+            found_coordinates[address] = coordinates
+        else:
+            missing.add(address)
+
+    records = Address.objects.in_bulk(missing, field_name='address')
+    stale = set()
+    for address in missing:
+        record = records.get(address)
+        if record and record.is_fresh():
+            coordinates = record.coordinates()
+            count('db_hits' if coordinates else 'negative_hits')
+            memory_cache.set(address, coordinates, record.expires_at())
+            found_coordinates[address] = coordinates
+        else:
+            stale.add(address)
+
+    if fetch and stale:
+        count('misses', len(stale))
+        found_coordinates.update(
+            save_lookups(records, fetch_many(stale, workers, rate_limiter)),
+        )
+    else:
+        for address in stale:
+            record = records.get(address)
+            found_coordinates[address] = record.coordinates() if record else None
+
+    return {
+        address: found_coordinates[normalized]
+        for address, normalized in normalized_addresses.items()
+    }
+
+
+def get_coordinates(address, fetch=True):
+    return get_many_coordinates([address], fetch=fetch)[address]
+
+
+def geocode_addresses(addresses, workers=None, rate_limiter=None):
+    found_coordinates = fetch_many(
+        (address.address for address in addresses),
+        workers,
+        rate_limiter,
+    )
+    now = timezone.now()
+    updated_addresses = []
+    for address in addresses:
+        coordinates = found_coordinates[address.address]
+        if coordinates:
+            address.latitude, address.longitude = coordinates
+            address.update_geohash()
+        else:
+            # Устаревшие координаты, если они были, оставляем, но отмечаем
+            # попытку, чтобы следующий запуск не спрашивал адрес снова
+            address.attempts += 1
+        address.request_date = now
+        updated_addresses.append(address)
+
+    Address.objects.bulk_update(
+        updated_addresses,
+        ['latitude', 'longitude', 'geohash', 'request_date', 'attempts'],
+    )
+    return addresses
+
+
+def geocode_pending(batch_size):
+    addresses = list(Address.objects.pending().order_by('pk')[:batch_size])
+    return geocode_addresses(addresses)
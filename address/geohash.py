@@ -0,0 +1,109 @@
+import math
+
+from django.db import models
+from django.db.models import F, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    if lat is None or lon is None:
+        return ''
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    for bit_number in range(precision * 5):
+        value, value_range = (
+            (lon, lon_range) if bit_number % 2 == 0 else (lat, lat_range)
+        )
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        if bit_number % 5 == 4:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def covering_prefixes(lat, lon, radius_km):
+    # Ищем самую мелкую ячейку, которая не меньше радиуса по обеим осям:
+    # тогда круг целиком покрывают она и восемь соседних
+    radius_lat = radius_km / KM_PER_DEGREE
+    farthest_lat = min(abs(lat) + radius_lat, 90)
+    lon_scale = math.cos(math.radians(farthest_lat))
+    radius_lon = radius_lat / lon_scale if lon_scale > 1e-9 else 360
+
+    precision = 0
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        cell_lat, cell_lon = cell_size(candidate)
+        if cell_lat < radius_lat or cell_lon < radius_lon:
+            break
+        precision = candidate
+    if not precision:
+        return None
+
+    cell_lat, cell_lon = cell_size(precision)
+    prefixes = set()
+    for lat_shift in (-1, 0, 1):
+        for lon_shift in (-1, 0, 1):
+            neighbour_lat = lat + lat_shift * cell_lat
+            if not -90 <= neighbour_lat <= 90:
+                continue
+            neighbour_lon = (lon + lon_shift * cell_lon + 180) % 360 - 180
+            prefixes.add(encode(neighbour_lat, neighbour_lon, precision))
+    return prefixes
+
+
+def prefix_upper_bound(prefix):
+    # Следующая строка после всех строк с этим префиксом: сравнение диапазоном
+    # использует обычный B-tree индекс и в SQLite, и в PostgreSQL
+    prefix = prefix.rstrip(GEOHASH_ALPHABET[-1])
+    if not prefix:
+        return None
+    next_char = GEOHASH_ALPHABET[GEOHASH_ALPHABET.index(prefix[-1]) + 1]
+    return prefix[:-1] + next_char
+
+
+def haversine_km(lat, lon):
+    lat_radians = math.radians(lat)
+    lon_radians = math.radians(lon)
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(
+        Power(Sin((Radians(F('latitude')) - Value(lat_radians)) / 2), 2)
+        + Value(math.cos(lat_radians)) * Cos(Radians(F('latitude')))
+        * Power(Sin((Radians(F('longitude')) - Value(lon_radians)) / 2), 2)
+    ))
+
+
+class GeohashQuerySet(models.QuerySet):
+    def within_km(self, lat, lon, radius):
+        queryset = self.filter(latitude__isnull=False, longitude__isnull=False)
+        prefixes = covering_prefixes(lat, lon, radius)
+        if prefixes:
+            cells = Q()
+            for prefix in prefixes:
+                upper_bound = prefix_upper_bound(prefix)
+                cell = Q(geohash__gte=prefix)
+                if upper_bound:
+                    cell &= Q(geohash__lt=upper_bound)
+                cells |= cell
+            queryset = queryset.filter(cells)
+        return (
+            queryset
+            .annotate(distance_km=haversine_km(lat, lon))
+            .filter(distance_km__lte=radius)
+        )
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from address.geocoding import geocode_pending
+
+
+class Command(BaseCommand):
+    help = 'Определяет координаты адресов из очереди геокодирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Пауза в секундах, когда очередь пуста',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать очередь один раз и выйти',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            addresses = geocode_pending(options['batch_size'])
+            if addresses:
+                resolved = sum(
+                    1 for address in addresses if address.latitude is not None
+                )
+                self.stdout.write(
+                    f'Обработано адресов: {len(addresses)}, '
+                    f'найдено координат: {resolved}'
+                )
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('address', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток геокодирования'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+import re
+
+from django.db import migrations
+from django.db.models import F
+
+
+def normalize_address(address):
+    address = address.lower().replace('ё', 'е')
+    address = re.sub(r'\s*,\s*', ', ', address)
+    return ' '.join(address.split()).strip(' ,')
+
+
+def normalize_addresses(apps, schema_editor):
+    Address = apps.get_model('address', 'Address')
+    kept = {}
+    duplicates = []
+    # Сначала адреса с координатами, чтобы при склейке дублей сохранить их
+    addresses = Address.objects.order_by(
+        F('latitude').asc(nulls_last=True),
+        '-request_date',
+    )
+    for address in addresses:
+        normalized = normalize_address(address.address)
+        if normalized in kept or not normalized:
+            duplicates.append(address.pk)
+        else:
+            kept[normalized] = address
+    Address.objects.filter(pk__in=duplicates).delete()
+
+    for normalized, address in kept.items():
+        if address.address != normalized:
+            address.address = normalized
+            address.save(update_fields=['address'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('address', '0002_address_attempts'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_addresses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+from address.geohash import encode
+
+
+def fill_geohash(apps, schema_editor):
+    Address = apps.get_model('address', 'Address')
+    located = Address.objects.filter(
+        latitude__isnull=False,
+        longitude__isnull=False,
+    )
+    records = []
+    for record in located.iterator():
+        record.geohash = encode(record.latitude, record.longitude)
+        records.append(record)
+    Address.objects.bulk_update(records, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('address', '0003_normalize_addresses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, verbose_name='Геохеш'),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
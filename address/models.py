@@ -1,6 +1,50 @@
+import re
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 
+from .geohash import GeohashQuerySet, encode
+
+
+def normalize_address(address):
+    address = address.lower().replace('ё', 'е')
+    address = re.sub(r'\s*,\s*', ', ', address)
+    return ' '.join(address.split()).strip(' ,')
+
+
+class AddressQuerySet(GeohashQuerySet):
+    def enqueue(self, addresses):
+        normalized_addresses = {
+            normalize_address(address) for address in addresses
+        }
+        return self.bulk_create(
+            [self.model(address=address) for address in normalized_addresses],
+            ignore_conflicts=True,
+        )
+
+    def pending(self):
+        retry_after = timezone.now() - timedelta(
+            seconds=settings.GEOCODER_NEGATIVE_TTL,
+        )
+        return self.filter(
+            Q(attempts=0) | Q(request_date__lte=retry_after),
+            latitude__isnull=True,
+            attempts__lt=settings.GEOCODER_MAX_ATTEMPTS,
+        )
+
+    def stale(self):
+        expired_before = timezone.now() - timedelta(
+            seconds=settings.GEOCODER_CACHE_TTL,
+        )
+        expired = self.filter(
+            latitude__isnull=False,
+            request_date__lte=expired_before,
+        )
+        return self.pending() | expired
+
 
 class Address(models.Model):
     address = models.CharField(
@@ -19,11 +63,23 @@ class Address(models.Model):
         null=True,
         blank=True,
     )
+    geohash = models.CharField(
+        'Геохеш',
+        max_length=12,
+        blank=True,
+        db_index=True,
+    )
     request_date = models.DateTimeField(
         'Дата запроса к геокодеру',
         default=timezone.now,
         db_index=True,
     )
+    attempts = models.PositiveSmallIntegerField(
+        'Попыток геокодирования',
+        default=0,
+    )
+
+    objects = AddressQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Адрес'
@@ -31,3 +87,24 @@ class Address(models.Model):
 
     def __str__(self):
         return self.address
+
+    def coordinates(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
+    def update_geohash(self):
+        self.geohash = encode(self.latitude, self.longitude)
+
+    def expires_at(self):
+        if self.coordinates():
+            ttl = settings.GEOCODER_CACHE_TTL
+        elif self.attempts:
+            ttl = settings.GEOCODER_NEGATIVE_TTL
+        else:
+            return self.request_date
+        return self.request_date + timedelta(seconds=ttl)
+
+    def is_fresh(self):
+        return self.expires_at() > timezone.now()
+
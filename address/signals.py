@@ -0,0 +1,9 @@
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from address.models import Address
+
+
+@receiver(pre_save, sender=Address)
+def update_address_geohash(sender, instance, **kwargs):
+    instance.update_geohash()
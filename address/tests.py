@@ -1,3 +1,254 @@
-from django.test import TestCase
+import math
+import random
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from geopy import distance
+import requests
+
+from .coordinates import GEOCODER_URL, CircuitBreaker, GeocoderUnavailable
+from .coordinates import fetch_coordinates, get_session
+from .geocoding import get_cache_stats, get_coordinates, memory_cache
+from .geohash import cell_size, covering_prefixes, encode
+from .models import Address, normalize_address
+
+# Фильтр считает по сфере, а geopy — по эллипсоиду: у самой границы
+# радиуса ответы могут расходиться на доли процента
+SPHERE_TOLERANCE = 0.006
+
+
+def geocoder_response(lat, lon):
+    response = mock.Mock()
+    response.json.return_value = {'response': {'GeoObjectCollection': {
+        'featureMember': [{'GeoObject': {'Point': {'pos': f'{lon} {lat}'}}}],
+    }}}
+    return response
+
+
+class GeocoderClientTests(SimpleTestCase):
+    def setUp(self):
+        self.session = mock.Mock()
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    def fetch(self, now=0):
+        with mock.patch(
+            'address.coordinates.get_session',
+            return_value=self.session,
+        ), mock.patch(
+            'address.coordinates.get_circuit_breaker',
+            return_value=self.breaker,
+        ), mock.patch('address.coordinates.time.monotonic', return_value=now):
+            return fetch_coordinates('apikey', 'Москва, Тверская, 1')
+
+    @override_settings(GEOCODER_RETRIES=3, GEOCODER_WORKERS=7)
+    def test_session_retries_and_keeps_connections(self):
+        with mock.patch('address.coordinates._session', None):
+            session = get_session()
+            self.assertIs(get_session(), session)
+        adapter = session.get_adapter(GEOCODER_URL)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+        self.assertEqual(adapter._pool_maxsize, 7)
+
+    @override_settings(GEOCODER_CONNECT_TIMEOUT=1, GEOCODER_READ_TIMEOUT=2)
+    def test_request_has_timeouts(self):
+        self.session.get.return_value = geocoder_response('55.75', '37.61')
+        self.assertEqual(self.fetch(), ('55.75', '37.61'))
+        self.assertEqual(self.session.get.call_args.kwargs['timeout'], (1, 2))
+
+    def test_breaker_stops_calls_until_timeout(self):
+        self.session.get.side_effect = requests.exceptions.Timeout
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.Timeout):
+                self.fetch(now=100)
+        with self.assertRaises(GeocoderUnavailable):
+            self.fetch(now=129)
+        self.assertEqual(self.session.get.call_count, 2)
+
+        # После паузы пропускается пробный запрос, удачный закрывает цепь
+        self.session.get.side_effect = None
+        self.session.get.return_value = geocoder_response('55.75', '37.61')
+        self.assertEqual(self.fetch(now=131), ('55.75', '37.61'))
+        self.assertEqual(self.session.get.call_count, 3)
+        self.assertEqual(self.breaker.failures, 0)
+        self.assertIsNone(self.breaker.opened_at)
+
+
+class GeocodeCacheTests(TestCase):
+    def setUp(self):
+        memory_cache.clear()
+        self.addCleanup(memory_cache.clear)
+        self.stats = get_cache_stats()
+
+    def stats_change(self):
+        stats = get_cache_stats()
+        return {
+            event: number - self.stats.get(event, 0)
+            for event, number in stats.items()
+            if number != self.stats.get(event, 0)
+        }
+
+    def test_normalize_address(self):
+        for address, normalized in [
+            ('  Москва ,Тверская   ул., д.1 ', 'москва, тверская ул., д.1'),
+            ('Ёлочная улица, 5,', 'елочная улица, 5'),
+            ('МОСКВА,\tАрбат,1', 'москва, арбат, 1'),
+        ]:
+            with self.subTest(address=address):
+                self.assertEqual(normalize_address(address), normalized)
+
+    def test_lookups_go_through_memory_then_database(self):
+        with mock.patch(
+            'address.geocoding.fetch_coordinates',
+            return_value=('55.75', '37.61'),
+        ) as fetch:
+            self.assertEqual(
+                get_coordinates('Москва, Тверская, 1'),
+                (55.75, 37.61),
+            )
+            self.assertEqual(
+                self.stats_change(),
+                {'misses': 1, 'upstream_requests': 1},
+            )
+            # Тот же адрес, записанный иначе, не идёт в геокодер
+            self.assertEqual(
+                get_coordinates('  москва,ТВЕРСКАЯ,  1'),
+                (55.75, 37.61),
+            )
+            memory_cache.clear()
+            self.assertEqual(
+                get_coordinates('Москва, Тверская, 1'),
+                (55.75, 37.61),
+            )
+
+        fetch.assert_called_once()
+        self.assertEqual(self.stats_change(), {
+            'misses': 1,
+            'upstream_requests': 1,
+            'memory_hits': 1,
+            'db_hits': 1,
+        })
+        self.assertEqual(
+            list(Address.objects.values_list('address', flat=True)),
+            ['москва, тверская, 1'],
+        )
+
+    def test_failed_lookup_is_cached_as_negative(self):
+        with mock.patch(
+            'address.geocoding.fetch_coordinates',
+            side_effect=requests.exceptions.Timeout,
+        ) as fetch:
+            self.assertIsNone(get_coordinates('Москва, Тверская, 1'))
+            self.assertIsNone(get_coordinates('Москва, Тверская, 1'))
+
+        fetch.assert_called_once()
+        self.assertEqual(self.stats_change()['negative_hits'], 1)
+        self.assertEqual(Address.objects.get().attempts, 1)
+
+    def test_stale_coordinates_are_served_when_refresh_fails(self):
+        Address.objects.create(
+            address='москва, тверская, 1',
+            latitude=55.75,
+            longitude=37.61,
+            request_date=timezone.now() - timedelta(days=365),
+        )
+        with mock.patch(
+            'address.geocoding.fetch_coordinates',
+            side_effect=requests.exceptions.Timeout,
+        ) as fetch:
+            self.assertEqual(
+                get_coordinates('Москва, Тверская, 1'),
+                (55.75, 37.61),
+            )
+            self.assertEqual(
+                get_coordinates('Москва, Тверская, 1'),
+                (55.75, 37.61),
+            )
+        fetch.assert_called_once()
+
+
+class WithinKmTests(TestCase):
+    RADII_KM = [0.3, 2, 15, 80, 400]
+
+    def setUp(self):
+        self.random = random.Random(19)
+
+    def cell_corner(self, lat, lon, precision):
+        cell_lat, cell_lon = cell_size(precision)
+        return (
+            math.floor((lat + 90) / cell_lat) * cell_lat - 90,
+            math.floor((lon + 180) / cell_lon) * cell_lon - 180,
+        )
+
+    def create_points(self, lat, lon, radius):
+        # Случайные точки вокруг центра и точки вплотную к границам ячеек,
+        # которые через него проходят
+        radius_lat = radius / 111 * 1.5
+        radius_lon = radius_lat / math.cos(math.radians(lat))
+        points = [
+            (
+                lat + self.random.uniform(-radius_lat, radius_lat),
+                lon + self.random.uniform(-radius_lon, radius_lon),
+            )
+            for _ in range(300)
+        ]
+        for shift in [-1e-9, 1e-9]:
+            points.extend(
+                (lat + shift, lon + self.random.uniform(-radius_lon, radius_lon))
+                for _ in range(25)
+            )
+            points.extend(
+                (lat + self.random.uniform(-radius_lat, radius_lat), lon + shift)
+                for _ in range(25)
+            )
+        Address.objects.all().delete()
+        Address.objects.bulk_create([
+            Address(
+                address=f'точка {number}',
+                latitude=point_lat,
+                longitude=point_lon,
+                geohash=encode(point_lat, point_lon),
+            )
+            for number, (point_lat, point_lon) in enumerate(points)
+        ])
+        Address.objects.create(address='без координат')
+        return {
+            f'точка {number}': distance.distance((lat, lon), point).km
+            for number, point in enumerate(points)
+        }
+
+    def test_within_km_matches_brute_force(self):
+        for radius in self.RADII_KM:
+            prefixes = covering_prefixes(55.75, 37.61, radius)
+            precision = len(next(iter(prefixes)))
+            lat, lon = self.cell_corner(55.75, 37.61, precision)
+            with self.subTest(radius=radius, precision=precision):
+                distances = self.create_points(lat, lon, radius)
+                found = set(
+                    Address.objects.within_km(lat, lon, radius)
+                    .values_list('address', flat=True)
+                )
+
+                inside = {
+                    address for address, km in distances.items()
+                    if km <= radius * (1 - SPHERE_TOLERANCE)
+                }
+                outside = {
+                    address for address, km in distances.items()
+                    if km > radius * (1 + SPHERE_TOLERANCE)
+                }
+                self.assertTrue(inside)
+                self.assertTrue(outside)
+                self.assertEqual(inside - found, set())
+                self.assertEqual(found & outside, set())
+                # Центр в углу ячейки: круг задевает все четыре соседние
+                self.assertEqual(
+                    len({
+                        geohash[:precision] for geohash in
+                        Address.objects.filter(address__in=found)
+                        .values_list('geohash', flat=True)
+                    }),
+                    4,
+                )
@@ -62,6 +62,14 @@ class App extends Component {
 
     let csrfToken = document.querySelector("[name=csrfmiddlewaretoken]").value;
 
+    // Повторная отправка того же заказа должна прийти с тем же ключом,
+    // тогда сервер не создаст дубль
+    if (!this.checkoutIdempotencyKey){
+      this.checkoutIdempotencyKey = window.crypto && window.crypto.randomUUID
+        ? window.crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    }
+
     try {
       let response = await fetch(url, {
         method: 'post',
@@ -69,15 +77,19 @@ class App extends Component {
           'Accept': 'application/json',
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken,
+          'Idempotency-Key': this.checkoutIdempotencyKey,
         },
         body: JSON.stringify(data),
       });
 
       if (!response.ok){
+        // Сервер ответил окончательно: исправленный заказ уйдёт с новым ключом
+        this.checkoutIdempotencyKey = null;
         alert('Ошибка при оформлении заказа. Попробуйте ещё раз или свяжитесь с нами по телефону.');
         return;
       }
       let responseData = await response.json();
+      this.checkoutIdempotencyKey = null;
 
       this.setState({
         cart: [],
@@ -159,6 +171,8 @@ class App extends Component {
   // Add to Cart
   handleAddToCart(selectedProducts){
 
+    // Другая корзина — другой заказ, старый ключ к нему не подходит
+    this.checkoutIdempotencyKey = null;
     let cartItems = this.state.cart;
     let productID = selectedProducts.id;
     let productQty = selectedProducts.quantity;
@@ -181,6 +195,7 @@ class App extends Component {
 
 
   handleRemoveProduct(id, e){
+    this.checkoutIdempotencyKey = null;
     let cart = this.state.cart;
     let index = cart.findIndex((x => x.id == id));
     cart.splice(index, 1);
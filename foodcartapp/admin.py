@@ -5,6 +5,7 @@ from django.utils.encoding import iri_to_uri
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
+from .geocoding import geocode_restaurants
 from .models import Product
 from .models import ProductCategory
 from .models import Restaurant
@@ -42,6 +43,17 @@ class RestaurantAdmin(admin.ModelAdmin):
     inlines = [
         RestaurantMenuItemInline
     ]
+    actions = [
+        'update_coordinates',
+    ]
+
+    def update_coordinates(self, request, queryset):
+        geocoded = geocode_restaurants(queryset)
+        self.message_user(
+            request,
+            f'Координаты найдены для {len(geocoded)} из {queryset.count()} ресторанов',
+        )
+    update_coordinates.short_description = 'Определить координаты'
 
 
 @admin.register(Product)
@@ -124,6 +136,9 @@ class OrderAdmin(admin.ModelAdmin):
     inlines = [
         OrderElementInline
     ]
+    readonly_fields = [
+        'total',
+    ]
 
     def response_change(self, request, obj):
         response = super(OrderAdmin, self).response_change(request, obj)
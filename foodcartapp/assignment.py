@@ -0,0 +1,59 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+INFEASIBLE_COST = 1e9
+
+
+def build_costs(distances, feasible):
+    return np.where(feasible & ~np.isnan(distances), distances, np.inf)
+
+
+def assign_greedy(costs, capacities):
+    capacities = np.array(capacities)
+    assignment = np.full(costs.shape[0], -1)
+
+    rows, columns = np.nonzero(np.isfinite(costs))
+    pairs = np.argsort(costs[rows, columns], kind='stable')
+    for row, column in zip(rows[pairs], columns[pairs]):
+        if assignment[row] != -1 or capacities[column] <= 0:
+            continue
+        assignment[row] = column
+        capacities[column] -= 1
+    return assignment
+
+
+def assign_matching(costs, capacities):
+    orders_count = costs.shape[0]
+    slots = np.repeat(
+        np.arange(costs.shape[1]),
+        np.minimum(capacities, orders_count).clip(min=0),
+    )
+    assignment = np.full(orders_count, -1)
+    if not len(slots):
+        return assignment
+
+    slot_costs = costs[:, slots]
+    slot_costs = np.where(np.isfinite(slot_costs), slot_costs, INFEASIBLE_COST)
+    rows, columns = linear_sum_assignment(slot_costs)
+    feasible = slot_costs[rows, columns] < INFEASIBLE_COST
+    assignment[rows[feasible]] = slots[columns[feasible]]
+    return assignment
+
+
+def assign_nearest(costs):
+    if not costs.shape[1]:
+        return np.full(costs.shape[0], -1)
+    assignment = np.argmin(costs, axis=1)
+    assignment[~np.isfinite(costs.min(axis=1, initial=np.inf))] = -1
+    return assignment
+
+
+def total_distance(costs, assignment):
+    assigned = assignment != -1
+    return costs[np.nonzero(assigned)[0], assignment[assigned]].sum()
+
+
+ASSIGNMENT_MODES = {
+    'greedy': assign_greedy,
+    'matching': assign_matching,
+}
@@ -0,0 +1,108 @@
+import numpy as np
+from django.db import transaction
+
+from .catalog import invalidate_catalog
+from .menu import invalidate_menu_index
+from .models import Product, Restaurant, RestaurantMenuItem
+from .utils import VersionedCache
+
+AVAILABILITY_MATRIX_CACHE_KEY = 'foodcartapp:availability_matrix'
+
+
+class AvailabilityMatrix:
+    def __init__(self, products, restaurants, menu_items):
+        products = list(products)
+        restaurants = list(restaurants)
+        self.product_ids = np.array(
+            [product_id for product_id, category_id in products],
+            dtype=np.int64,
+        )
+        self.category_ids = np.array(
+            [category_id or 0 for product_id, category_id in products],
+            dtype=np.int64,
+        )
+        self.restaurant_ids = [
+            restaurant_id for restaurant_id, name in restaurants
+        ]
+        self.restaurant_names = [name for restaurant_id, name in restaurants]
+
+        rows = {
+            product_id: row
+            for row, product_id in enumerate(self.product_ids.tolist())
+        }
+        columns = {
+            restaurant_id: column
+            for column, restaurant_id in enumerate(self.restaurant_ids)
+        }
+        available = np.zeros((len(products), len(restaurants)), dtype=bool)
+        for product_id, restaurant_id in menu_items:
+            row = rows.get(product_id)
+            column = columns.get(restaurant_id)
+            if row is not None and column is not None:
+                available[row, column] = True
+        # По биту на ячейку: 2000 товаров × 80 ресторанов занимают 20 КБ
+        self.bits = np.packbits(available, axis=1)
+
+    def filter(self, category_id=None):
+        if category_id is None:
+            return np.arange(len(self.product_ids))
+        return np.flatnonzero(self.category_ids == category_id)
+
+    def rows(self, positions):
+        return np.unpackbits(
+            self.bits[positions],
+            axis=1,
+            count=len(self.restaurant_ids),
+        ).astype(bool)
+
+
+def build_availability_matrix():
+    return AvailabilityMatrix(
+        Product.objects.order_by('id').values_list('id', 'category'),
+        Restaurant.objects.order_by('name', 'id').values_list('id', 'name'),
+        RestaurantMenuItem.objects.filter(availability=True)
+        .values_list('product', 'restaurant'),
+    )
+
+
+availability_matrix_cache = VersionedCache(
+    AVAILABILITY_MATRIX_CACHE_KEY,
+    build_availability_matrix,
+)
+
+
+def get_availability_matrix():
+    return availability_matrix_cache.get()
+
+
+def invalidate_availability_matrix():
+    availability_matrix_cache.invalidate()
+
+
+def invalidate_menu_caches():
+    invalidate_menu_index()
+    invalidate_availability_matrix()
+    invalidate_catalog()
+
+
+def select_menu_items(pairs=None, category=None, restaurants=None):
+    if pairs is None and category is None and restaurants is None:
+        raise ValueError('Укажите пары ресторан–товар, категорию или рестораны')
+    menu_items = RestaurantMenuItem.objects.all()
+    if pairs is not None:
+        menu_items = menu_items.for_pairs(pairs)
+    if category is not None:
+        menu_items = menu_items.filter(product__category=category)
+    if restaurants is not None:
+        menu_items = menu_items.filter(restaurant__in=restaurants)
+    return menu_items
+
+
+def set_availability(menu_items, availability):
+    updated = menu_items.exclude(availability=availability)\
+        .update(availability=availability)
+    # update() не отправляет сигналы, поэтому кэши сбрасываем сами и один раз,
+    # когда изменения уже видны другим запросам
+    if updated:
+        transaction.on_commit(invalidate_menu_caches)
+    return updated
@@ -0,0 +1,84 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .menu import get_menu_index
+from .models import Product
+from .utils import VersionedCache
+
+CATALOG_CACHE_KEY = 'foodcartapp:catalog'
+CATALOG_PAGE_SIZE = 20
+CATALOG_MAX_PAGE_SIZE = 100
+
+
+def serialize_product(product, menu_index):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': product.image.url,
+        'restaurants': sorted(menu_index.restaurants.get(product.id, ())),
+    }
+
+
+def build_catalog():
+    products = Product.objects.select_related('category').available()
+    menu_index = get_menu_index()
+    content = json.dumps(
+        [serialize_product(product, menu_index) for product in products],
+        cls=DjangoJSONEncoder,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    ).encode()
+    return {
+        'content': content,
+        'etag': hashlib.sha1(content).hexdigest(),
+        'last_modified': timezone.now().replace(microsecond=0),
+    }
+
+
+catalog_cache = VersionedCache(CATALOG_CACHE_KEY, build_catalog)
+
+
+def get_catalog():
+    return catalog_cache.get()
+
+
+def invalidate_catalog():
+    catalog_cache.invalidate()
+
+
+def filter_catalog(category=None, special_status=None, restaurant=None,
+                   cursor=None, limit=CATALOG_PAGE_SIZE):
+    products = Product.objects.select_related('category').order_by('id')
+    if restaurant is None:
+        products = products.available()
+    else:
+        products = products.filter(
+            menu_items__restaurant=restaurant,
+            menu_items__availability=True,
+        )
+    if category is not None:
+        products = products.filter(category=category)
+    if special_status is not None:
+        products = products.filter(special_status=special_status)
+    if cursor is not None:
+        products = products.filter(id__gt=cursor)
+
+    page = list(products[:limit + 1])
+    next_cursor = page[limit - 1].id if len(page) > limit else None
+    menu_index = get_menu_index()
+    return {
+        'results': [
+            serialize_product(product, menu_index) for product in page[:limit]
+        ],
+        'next_cursor': next_cursor,
+    }
@@ -0,0 +1,27 @@
+from django.conf import settings
+
+from address.geocoding import get_coordinates
+
+from .menu import get_menu_index
+from .spatial import get_restaurant_index
+
+
+def can_deliver(address, product_ids):
+    available_in = get_menu_index().restaurants_for(product_ids)
+    if not available_in:
+        return False
+    if not settings.DELIVERY_RADIUS_KM:
+        return True
+
+    coordinates = get_coordinates(address, fetch=False)
+    if not coordinates:
+        # Адрес ещё не геокодирован, решение остаётся за менеджером
+        return None
+    nearest = get_restaurant_index().nearest(
+        *coordinates,
+        restricted_to=available_in,
+    )
+    if not nearest:
+        return None
+    restaurant_id, km = nearest[0]
+    return km <= settings.DELIVERY_RADIUS_KM
@@ -0,0 +1,60 @@
+import numpy as np
+from geopy import distance
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_coordinates_array(points):
+    coordinates = [
+        (np.nan, np.nan) if lat is None or lon is None else (lat, lon)
+        for lat, lon in points
+    ]
+    return np.array(coordinates, dtype=float).reshape(-1, 2)
+
+
+def haversine_matrix(origins, destinations):
+    origins = np.radians(origins)
+    destinations = np.radians(destinations)
+
+    lat1 = origins[:, 0, np.newaxis]
+    lon1 = origins[:, 1, np.newaxis]
+    lat2 = destinations[np.newaxis, :, 0]
+    lon2 = destinations[np.newaxis, :, 1]
+
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def geodesic_matrix(origins, destinations):
+    matrix = np.full((len(origins), len(destinations)), np.nan)
+    for row, origin in enumerate(origins):
+        if np.isnan(origin).any():
+            continue
+        for column, destination in enumerate(destinations):
+            if np.isnan(destination).any():
+                continue
+            matrix[row, column] = distance.distance(origin, destination).km
+    return matrix
+
+
+class RestaurantDistances:
+    def __init__(self, restaurants, geodesic=False):
+        self.restaurants = list(restaurants)
+        self.coordinates = to_coordinates_array(
+            (restaurant.latitude, restaurant.longitude)
+            for restaurant in self.restaurants
+        )
+        self.columns = {
+            restaurant.id: column
+            for column, restaurant in enumerate(self.restaurants)
+        }
+        self.geodesic = geodesic
+
+    def matrix(self, points):
+        origins = to_coordinates_array(points)
+        if self.geodesic:
+            return geodesic_matrix(origins, self.coordinates)
+        return haversine_matrix(origins, self.coordinates)
@@ -0,0 +1,45 @@
+from django.db import transaction
+
+from address.geocoding import get_many_coordinates
+from address.models import Address, normalize_address
+
+from .models import Restaurant
+from .spatial import invalidate_restaurant_index
+
+
+def geocode_restaurants(restaurants, workers=None, rate_limiter=None):
+    restaurants = [restaurant for restaurant in restaurants if restaurant.address]
+    found_coordinates = get_many_coordinates(
+        [restaurant.address for restaurant in restaurants],
+        workers=workers,
+        rate_limiter=rate_limiter,
+    )
+
+    geocoded = []
+    for restaurant in restaurants:
+        coordinates = found_coordinates[restaurant.address]
+        if not coordinates:
+            continue
+        restaurant.latitude, restaurant.longitude = coordinates
+        restaurant.update_geohash()
+        geocoded.append(restaurant)
+
+    Restaurant.objects.bulk_update(
+        geocoded,
+        ['latitude', 'longitude', 'geohash'],
+    )
+    transaction.on_commit(invalidate_restaurant_index)
+    return geocoded
+
+
+def get_orders_coordinates(orders):
+    addresses_coords = {
+        address: (latitude, longitude)
+        for address, latitude, longitude in Address.objects.filter(
+            address__in={normalize_address(order.address) for order in orders},
+        ).values_list('address', 'latitude', 'longitude')
+    }
+    return [
+        addresses_coords.get(normalize_address(order.address), (None, None))
+        for order in orders
+    ]
@@ -0,0 +1,64 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from .models import Product
+from .serializers import OrderSerializer, bulk_create_orders
+from .utils import InvalidLine, iterate_chunks
+
+BULK_ORDERS_CHUNK_SIZE = 500
+
+
+def collect_product_ids(payloads):
+    product_ids = set()
+    for payload in payloads:
+        if not isinstance(payload, dict):
+            continue
+        products = payload.get('products')
+        if not isinstance(products, list):
+            continue
+        for fields in products:
+            try:
+                product_ids.add(int(fields['product']))
+            except (KeyError, TypeError, ValueError):
+                continue
+    return product_ids
+
+
+def register_orders_chunk(payloads, first_index):
+    products = Product.objects.in_bulk(collect_product_ids(payloads))
+
+    # Один экземпляр сериализатора на пачку: DRF строит поля лишь однажды
+    serializer = OrderSerializer(context={'products': products})
+    results = []
+    valid_orders = []
+    for index, payload in enumerate(payloads, first_index):
+        if isinstance(payload, InvalidLine):
+            results.append({'index': index, 'errors': {
+                'non_field_errors': [f'Некорректный JSON: {payload.error}'],
+            }})
+            continue
+        try:
+            valid_orders.append((index, serializer.run_validation(payload)))
+        except ValidationError as error:
+            results.append({
+                'index': index,
+                'errors': as_serializer_error(error),
+            })
+
+    orders = bulk_create_orders([
+        validated_data for index, validated_data in valid_orders
+    ])
+    for (index, validated_data), order in zip(valid_orders, orders):
+        results.append({'index': index, 'id': order.id})
+
+    results.sort(key=lambda result: result['index'])
+    return results
+
+
+def register_orders(payloads, chunk_size=BULK_ORDERS_CHUNK_SIZE):
+    results = []
+    first_index = 0
+    for chunk in iterate_chunks(payloads, chunk_size):
+        results.extend(register_orders_chunk(chunk, first_index))
+        first_index += len(chunk)
+    return results
@@ -0,0 +1,128 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from foodcartapp.assignment import (
+    ASSIGNMENT_MODES,
+    assign_nearest,
+    build_costs,
+    total_distance,
+)
+from foodcartapp.distances import RestaurantDistances
+from foodcartapp.geocoding import get_orders_coordinates
+from foodcartapp.menu import get_menu_index
+from foodcartapp.models import Order, Restaurant
+
+
+def format_overhead(assigned_km, nearest_km):
+    if not nearest_km:
+        return ''
+    return f' (+{assigned_km / nearest_km - 1:.1%})'
+
+
+class Command(BaseCommand):
+    help = 'Назначает необработанным заказам ближайшие рестораны с учётом их загрузки'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=ASSIGNMENT_MODES.keys(),
+            default='greedy',
+        )
+        parser.add_argument(
+            '--capacity',
+            type=int,
+            default=10,
+            help='Сколько заказов в работе может быть у одного ресторана',
+        )
+        parser.add_argument('--limit', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        orders = list(
+            Order.objects.filter(status='01_created', restaurant__isnull=True)
+            .prefetch_related('elements')
+            .order_by('registered_at', 'id')[:options['limit']]
+        )
+        restaurants = list(Restaurant.objects.all())
+        if not orders or not restaurants:
+            self.stdout.write('Нечего назначать')
+            return
+
+        restaurants_load = dict(
+            Order.objects.filter(
+                status__in=['01_created', '02_cooking'],
+                restaurant__isnull=False,
+            ).values_list('restaurant').annotate(count=Count('id'))
+        )
+        capacities = np.array([
+            max(options['capacity'] - restaurants_load.get(restaurant.id, 0), 0)
+            for restaurant in restaurants
+        ])
+
+        restaurant_distances = RestaurantDistances(
+            restaurants,
+            geodesic=settings.GEODESIC_DISTANCES,
+        )
+        distances = restaurant_distances.matrix(get_orders_coordinates(orders))
+        menu_index = get_menu_index()
+        feasible = np.zeros(distances.shape, dtype=bool)
+        for row, order in enumerate(orders):
+            available_in = menu_index.restaurants_for(
+                element.product_id for element in order.elements.all()
+            )
+            for restaurant_id in available_in:
+                column = restaurant_distances.columns.get(restaurant_id)
+                if column is not None:
+                    feasible[row, column] = True
+        costs = build_costs(distances, feasible)
+
+        started_at = time.monotonic()
+        assignment = ASSIGNMENT_MODES[options['mode']](costs, capacities)
+        elapsed = time.monotonic() - started_at
+
+        assigned = assignment != -1
+        nearest = assign_nearest(costs)
+        assigned_km = total_distance(costs, assignment)
+        nearest_km = total_distance(costs[assigned], nearest[assigned])
+        self.stdout.write(
+            f'Назначено {assigned.sum()} из {len(orders)} заказов '
+            f'за {elapsed * 1000:.0f} мс'
+        )
+        if assigned.any():
+            self.stdout.write(
+                f'Суммарное расстояние {assigned_km:.1f} км, '
+                f'в среднем {assigned_km / assigned.sum():.2f} км; '
+                f'если бы каждый заказ достался ближайшему ресторану: '
+                f'{nearest_km:.1f} км{format_overhead(assigned_km, nearest_km)}, '
+                f'ближайший ресторан получили '
+                f'{(assignment[assigned] == nearest[assigned]).sum()} заказов'
+            )
+
+        if options['dry_run']:
+            return
+        now = timezone.now()
+        skipped = []
+        with transaction.atomic():
+            for order, column in zip(orders, assignment):
+                if column == -1:
+                    continue
+                # Пока считали, менеджер мог сам назначить ресторан
+                # или другой запуск команды успел раньше
+                updated = Order.objects.filter(
+                    pk=order.pk,
+                    status='01_created',
+                    restaurant__isnull=True,
+                ).update(restaurant=restaurants[column], updated_at=now)
+                if not updated:
+                    skipped.append(order.pk)
+        if skipped:
+            self.stdout.write(
+                f'Пропущено {len(skipped)} заказов, которые уже назначены '
+                f'или взяты в работу: {", ".join(map(str, skipped))}'
+            )
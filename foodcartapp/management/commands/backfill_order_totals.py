@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохранённую стоимость заказов по их позициям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        last_pk = Order.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        chunk_size = options['chunk_size']
+        updated = 0
+        for first_pk in range(1, last_pk + 1, chunk_size):
+            updated += Order.objects.filter(
+                pk__gte=first_pk,
+                pk__lt=first_pk + chunk_size,
+            ).update_totals()
+        self.stdout.write(f'Пересчитано заказов: {updated}')
@@ -0,0 +1,282 @@
+import json
+import random
+import time
+import tracemalloc
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from foodcartapp.availability import build_availability_matrix
+from foodcartapp.catalog import build_catalog, filter_catalog
+from foodcartapp.distances import RestaurantDistances
+from foodcartapp.menu import get_menu_index
+from foodcartapp.models import Product, ProductCategory, Restaurant
+from foodcartapp.models import RestaurantMenuItem
+from foodcartapp.views import register_order
+from restaurateur.views import view_products
+
+# Замеры работают со своим кэшем: кэш сайта не сбрасывается,
+# а в замер не попадают данные, собранные по настоящей базе
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    },
+}
+SCENARIO_DEFAULTS = {
+    'distances': {'restaurants': 30, 'orders': [100, 1000, 10000]},
+    'catalog': {'restaurants': 10, 'products': 10000},
+    'orders': {
+        'restaurants': 1,
+        'products': 100,
+        'carts': [1, 5, 50],
+        'repeat': 20,
+    },
+    'availability': {'restaurants': 80, 'products': 2000},
+}
+# По этому префиксу сгенерированные записи отличаются от настоящих
+SEED_PREFIX = 'Замер'
+
+
+def measure(function, *args, **kwargs):
+    started_at = time.monotonic()
+    result = function(*args, **kwargs)
+    return result, time.monotonic() - started_at
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет горячие места сайта на сгенерированных данных. '
+        'Всё, что команда записала в базу, по окончании откатывается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=SCENARIO_DEFAULTS.keys())
+        parser.add_argument('--restaurants', type=int)
+        parser.add_argument('--products', type=int)
+        parser.add_argument(
+            '--orders',
+            type=int,
+            nargs='+',
+            help='Сколько заказов сгенерировать, можно несколько значений',
+        )
+        parser.add_argument(
+            '--carts',
+            type=int,
+            nargs='+',
+            help='Сколько товаров в корзине, можно несколько значений',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            help='Сколько раз повторить замер, в отчёте среднее время',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        scenario = options['scenario']
+        params = {
+            **SCENARIO_DEFAULTS[scenario],
+            **{
+                name: value for name, value in options.items()
+                if name in SCENARIO_DEFAULTS[scenario] and value is not None
+            },
+        }
+        with override_settings(CACHES=BENCHMARK_CACHES), transaction.atomic():
+            cache.clear()
+            getattr(self, f'benchmark_{scenario}')(**params)
+            transaction.set_rollback(True)
+
+    def random_point(self):
+        return (
+            self.random.uniform(55.55, 55.95),
+            self.random.uniform(37.35, 37.85),
+        )
+
+    def seed_restaurants(self, restaurants_count):
+        restaurants = [
+            Restaurant(
+                name=f'{SEED_PREFIX} ресторан {number}',
+                address=f'{SEED_PREFIX} адрес {number}',
+            )
+            for number in range(restaurants_count)
+        ]
+        for restaurant in restaurants:
+            restaurant.latitude, restaurant.longitude = self.random_point()
+        Restaurant.objects.bulk_create(restaurants)
+        return list(
+            Restaurant.objects.filter(name__startswith=SEED_PREFIX)
+            .order_by('id')
+        )
+
+    def seed_catalog(self, products_count, restaurants, categories_count=10):
+        ProductCategory.objects.bulk_create([
+            ProductCategory(name=f'{SEED_PREFIX} категория {number}')
+            for number in range(categories_count)
+        ])
+        category_ids = list(
+            ProductCategory.objects.filter(name__startswith=SEED_PREFIX)
+            .values_list('id', flat=True)
+        )
+        Product.objects.bulk_create([
+            Product(
+                name=f'{SEED_PREFIX} товар {number}',
+                category_id=self.random.choice(category_ids),
+                price=self.random.randint(100, 1000),
+                image='burger.jpg',
+                special_status=self.random.random() < 0.1,
+                description='Сгенерированный товар для замеров',
+            )
+            for number in range(products_count)
+        ])
+        product_ids = list(
+            Product.objects.filter(name__startswith=SEED_PREFIX)
+            .order_by('id').values_list('id', flat=True)
+        )
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(
+                restaurant=restaurant,
+                product_id=product_id,
+                availability=self.random.random() < 0.7,
+            )
+            for restaurant in restaurants
+            for product_id in product_ids
+        ])
+        return category_ids, product_ids
+
+    def benchmark_distances(self, restaurants, orders):
+        restaurants = [
+            Restaurant(id=number, name=f'Ресторан {number}')
+            for number in range(1, restaurants + 1)
+        ]
+        for restaurant in restaurants:
+            restaurant.latitude, restaurant.longitude = self.random_point()
+        haversine = RestaurantDistances(restaurants)
+        geodesic = RestaurantDistances(restaurants, geodesic=True)
+
+        for orders_count in orders:
+            points = [self.random_point() for _ in range(orders_count)]
+            fast, fast_elapsed = measure(haversine.matrix, points)
+            exact, exact_elapsed = measure(geodesic.matrix, points)
+            error = np.max(np.abs(fast - exact) / exact)
+            self.stdout.write(
+                f'{orders_count} заказов × {len(restaurants)} ресторанов: '
+                f'geodesic по парам {exact_elapsed:.2f} с, '
+                f'матрица haversine {fast_elapsed * 1000:.1f} мс, '
+                f'расхождение до {error:.2%}'
+            )
+
+    def benchmark_catalog(self, restaurants, products):
+        restaurants = self.seed_restaurants(restaurants)
+        category_ids, product_ids = self.seed_catalog(products, restaurants)
+        get_menu_index()
+
+        catalog, elapsed = measure(build_catalog)
+        self.stdout.write(
+            f'Весь каталог, {len(product_ids)} товаров × '
+            f'{len(restaurants)} ресторанов: '
+            f'{len(catalog["content"]) / 1024:.0f} КБ, {elapsed * 1000:.0f} мс'
+        )
+
+        pages = [
+            ('первая страница', {}),
+            ('категория', {'category': category_ids[0]}),
+            (
+                'ресторан и спецпредложения',
+                {'restaurant': restaurants[0].id, 'special_status': True},
+            ),
+            ('страница по курсору', {'cursor': product_ids[len(product_ids) // 2]}),
+        ]
+        for title, filters in pages:
+            with CaptureQueriesContext(connection) as queries:
+                page, elapsed = measure(filter_catalog, **filters)
+            content = json.dumps(page, cls=DjangoJSONEncoder, ensure_ascii=False)
+            self.stdout.write(
+                f'{title}: {len(page["results"])} товаров, '
+                f'{len(content.encode()) / 1024:.1f} КБ, '
+                f'{len(queries)} запросов, {elapsed * 1000:.1f} мс'
+            )
+
+    def benchmark_orders(self, restaurants, products, carts, repeat):
+        restaurants = self.seed_restaurants(restaurants)
+        _, product_ids = self.seed_catalog(products, restaurants)
+        available_ids = list(
+            RestaurantMenuItem.objects.filter(
+                product__in=product_ids,
+                availability=True,
+            ).values_list('product', flat=True).distinct()
+        )
+        get_menu_index()
+        factory = APIRequestFactory()
+
+        for cart_size in carts:
+            if cart_size > len(available_ids):
+                raise CommandError(
+                    f'В продаже только {len(available_ids)} товаров, '
+                    f'корзину на {cart_size} не собрать'
+                )
+            payload = {
+                'address': 'Москва, Тверская, 1',
+                'firstname': 'Иван',
+                'lastname': 'Петров',
+                'phonenumber': '+79001234567',
+                'products': [
+                    {'product': product_id, 'quantity': 1}
+                    for product_id in self.random.sample(available_ids, cart_size)
+                ],
+            }
+            elapsed = 0
+            for _ in range(repeat):
+                request = factory.post('/api/order/', payload, format='json')
+                with CaptureQueriesContext(connection) as queries:
+                    response, request_elapsed = measure(register_order, request)
+                if response.status_code != 201:
+                    raise CommandError(f'Заказ не принят: {response.data}')
+                elapsed += request_elapsed
+            self.stdout.write(
+                f'Корзина на {cart_size} товаров: {len(queries)} запросов, '
+                f'в среднем {elapsed / repeat * 1000:.1f} мс'
+            )
+
+    def benchmark_availability(self, restaurants, products):
+        restaurants = self.seed_restaurants(restaurants)
+        category_ids, product_ids = self.seed_catalog(products, restaurants)
+
+        matrix, elapsed = measure(build_availability_matrix)
+        self.stdout.write(
+            f'Матрица {len(product_ids)} товаров × {len(restaurants)} '
+            f'ресторанов: {matrix.bits.nbytes / 1024:.0f} КБ, '
+            f'{elapsed * 1000:.0f} мс'
+        )
+
+        factory = RequestFactory()
+        manager = User(username='manager', is_staff=True)
+        pages = [
+            ('страница без кэша', {}),
+            ('страница из кэша', {}),
+            (
+                'категория, вторая страница',
+                {'category': category_ids[0], 'page': 2},
+            ),
+        ]
+        for title, params in pages:
+            request = factory.get('/manager/products/', params)
+            request.user = manager
+            tracemalloc.start()
+            with CaptureQueriesContext(connection) as queries:
+                response, elapsed = measure(view_products, request)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stdout.write(
+                f'{title}: {elapsed * 1000:.0f} мс, '
+                f'пик памяти {peak / 2 ** 20:.1f} МБ, {len(queries)} запросов, '
+                f'{len(response.content) / 2 ** 20:.1f} МБ HTML'
+            )
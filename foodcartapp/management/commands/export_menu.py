@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.menu_transfer import export_menu_rows, write_menu
+
+
+class Command(BaseCommand):
+    help = 'Выгружает меню всех ресторанов в CSV или JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки, по умолчанию стандартный вывод',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            default='csv',
+        )
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            write_menu(export_menu_rows(), self.stdout, options['format'])
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as stream:
+            write_menu(export_menu_rows(), stream, options['format'])
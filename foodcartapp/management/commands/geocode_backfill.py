@@ -0,0 +1,89 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from address.geocoding import RateLimiter, geocode_addresses
+from address.models import Address
+from foodcartapp.geocoding import geocode_restaurants
+from foodcartapp.models import Restaurant
+
+
+def iterate_pk_chunks(queryset, chunk_size):
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+class Command(BaseCommand):
+    help = 'Заполняет недостающие и устаревшие координаты адресов и ресторанов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.GEOCODER_WORKERS,
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=10,
+            help='Не больше стольких запросов к геокодеру в секунду, 0 — без ограничений',
+        )
+        parser.add_argument(
+            '--skip-addresses',
+            action='store_true',
+        )
+        parser.add_argument(
+            '--skip-restaurants',
+            action='store_true',
+        )
+
+    def handle(self, *args, **options):
+        rate_limiter = RateLimiter(options['rate'])
+        if not options['skip_addresses']:
+            self.backfill(
+                'Адреса',
+                iterate_pk_chunks(Address.objects.stale(), options['chunk_size']),
+                lambda chunk: sum(
+                    1 for address in geocode_addresses(
+                        chunk,
+                        options['workers'],
+                        rate_limiter,
+                    )
+                    if address.coordinates()
+                ),
+            )
+        if not options['skip_restaurants']:
+            restaurants = Restaurant.objects.filter(
+                latitude__isnull=True,
+            ).exclude(address='')
+            self.backfill(
+                'Рестораны',
+                iterate_pk_chunks(restaurants, options['chunk_size']),
+                lambda chunk: len(geocode_restaurants(
+                    chunk,
+                    options['workers'],
+                    rate_limiter,
+                )),
+            )
+
+    def backfill(self, title, chunks, geocode_chunk):
+        started_at = time.monotonic()
+        processed = 0
+        resolved = 0
+        for chunk in chunks:
+            resolved += geocode_chunk(chunk)
+            processed += len(chunk)
+            elapsed = time.monotonic() - started_at
+            self.stdout.write(
+                f'{title}: обработано {processed}, найдено {resolved}, '
+                f'{processed / elapsed:.1f} адресов/с'
+            )
+        if not processed:
+            self.stdout.write(f'{title}: нечего обновлять')
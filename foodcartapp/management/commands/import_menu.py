@@ -0,0 +1,97 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from address.geocoding import RateLimiter
+from foodcartapp.geocoding import geocode_restaurants
+from foodcartapp.menu_transfer import (
+    MENU_IMPORT_CHUNK_SIZE,
+    import_menu,
+    read_menu_rows,
+)
+from foodcartapp.models import Restaurant
+from foodcartapp.utils import iterate_chunks
+
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = 'Загружает рестораны, товары и пункты меню из CSV или JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='По умолчанию определяется по расширению файла',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=MENU_IMPORT_CHUNK_SIZE,
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.GEOCODER_WORKERS,
+        )
+        parser.add_argument('--rate', type=float, default=10)
+        parser.add_argument(
+            '--skip-geocoding',
+            action='store_true',
+            help='Не геокодировать новые адреса ресторанов, это сделает geocode_backfill',
+        )
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or (
+            'csv' if options['path'].endswith('.csv') else 'jsonl'
+        )
+        started_at = time.monotonic()
+        menu_import = None
+        with open(options['path'], encoding='utf-8', newline='') as stream:
+            rows = read_menu_rows(stream, file_format)
+            for menu_import in import_menu(rows, options['chunk_size']):
+                elapsed = time.monotonic() - started_at
+                self.stdout.write(
+                    f'Обработано строк: {menu_import.processed}, '
+                    f'{menu_import.processed / elapsed:.0f} строк/с'
+                )
+        if menu_import is None:
+            self.stdout.write('Файл пуст')
+            return
+
+        for entity, title in [
+            ('restaurants', 'Рестораны'),
+            ('products', 'Товары'),
+            ('menu_items', 'Пункты меню'),
+        ]:
+            self.stdout.write(
+                f'{title}: создано {menu_import.created[entity]}, '
+                f'изменено {menu_import.updated[entity]}'
+            )
+        for number, error in menu_import.errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f'Запись {number}: {error}')
+        if len(menu_import.errors) > MAX_REPORTED_ERRORS:
+            self.stderr.write(
+                f'И ещё ошибок: {len(menu_import.errors) - MAX_REPORTED_ERRORS}'
+            )
+
+        if options['skip_geocoding'] or not menu_import.restaurants_to_geocode:
+            return
+        # Геокодируем разом после загрузки, а не по запросу на каждый ресторан
+        rate_limiter = RateLimiter(options['rate'])
+        geocoded = 0
+        for restaurant_ids in iterate_chunks(
+            sorted(menu_import.restaurants_to_geocode),
+            options['chunk_size'],
+        ):
+            geocoded += len(geocode_restaurants(
+                Restaurant.objects.filter(pk__in=restaurant_ids),
+                options['workers'],
+                rate_limiter,
+            ))
+        self.stdout.write(
+            f'Геокодировано ресторанов: {geocoded} '
+            f'из {len(menu_import.restaurants_to_geocode)}'
+        )
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.rollups import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Заново строит сводки продаж по всем заказам'
+
+    def handle(self, *args, **options):
+        started_at = time.monotonic()
+        for start, end in rebuild_sales_rollups():
+            self.stdout.write(f'Пересчитано: {start:%Y-%m-%d} — {end:%Y-%m-%d}')
+        self.stdout.write(
+            f'Готово за {time.monotonic() - started_at:.1f} с'
+        )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from foodcartapp.availability import select_menu_items, set_availability
+
+
+def parse_pair(value):
+    restaurant_id, _, product_id = value.partition(':')
+    return int(restaurant_id), int(product_id)
+
+
+class Command(BaseCommand):
+    help = 'Разом включает или выключает продажу пунктов меню ресторанов'
+
+    def add_arguments(self, parser):
+        state = parser.add_mutually_exclusive_group(required=True)
+        state.add_argument('--on', dest='availability', action='store_true')
+        state.add_argument('--off', dest='availability', action='store_false')
+        parser.add_argument(
+            '--pair',
+            dest='pairs',
+            action='append',
+            type=parse_pair,
+            help='Пара ресторан:товар, можно указать несколько раз',
+        )
+        parser.add_argument('--category', type=int)
+        parser.add_argument(
+            '--restaurant',
+            dest='restaurants',
+            action='append',
+            type=int,
+        )
+
+    def handle(self, *args, **options):
+        try:
+            menu_items = select_menu_items(
+                pairs=options['pairs'],
+                category=options['category'],
+                restaurants=options['restaurants'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        updated = set_availability(menu_items, options['availability'])
+        self.stdout.write(f'Изменено пунктов меню: {updated}')
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.rollups import update_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводки продаж за периоды, в которых менялись заказы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=60,
+            help='Пауза в секундах между пересчётами',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Пересчитать один раз и выйти',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            hours = update_sales_rollups()
+            if hours:
+                self.stdout.write(f'Пересчитано часов: {hours}')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
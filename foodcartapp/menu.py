@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+from .models import RestaurantMenuItem
+from .utils import VersionedCache
+
+MENU_INDEX_CACHE_KEY = 'foodcartapp:menu_index'
+
+
+class MenuIndex:
+    def __init__(self, menu_items):
+        restaurants = defaultdict(set)
+        for product_id, restaurant_id in menu_items:
+            restaurants[product_id].add(restaurant_id)
+        self.restaurants = {
+            product_id: frozenset(restaurant_ids)
+            for product_id, restaurant_ids in restaurants.items()
+        }
+
+    def restaurants_for(self, product_ids):
+        product_ids = set(product_ids)
+        if not product_ids:
+            return frozenset()
+        return frozenset.intersection(*[
+            self.restaurants.get(product_id, frozenset())
+            for product_id in product_ids
+        ])
+
+
+def build_menu_index():
+    menu_items = (
+        RestaurantMenuItem.objects
+        .filter(availability=True)
+        .values_list('product', 'restaurant')
+    )
+    return MenuIndex(menu_items)
+
+
+menu_index_cache = VersionedCache(MENU_INDEX_CACHE_KEY, build_menu_index)
+
+
+def get_menu_index():
+    return menu_index_cache.get()
+
+
+def invalidate_menu_index():
+    menu_index_cache.invalidate()
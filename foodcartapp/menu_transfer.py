@@ -0,0 +1,335 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .availability import invalidate_menu_caches
+from .models import Product, ProductCategory, Restaurant, RestaurantMenuItem
+from .spatial import invalidate_restaurant_index
+from .utils import InvalidLine, iterate_chunks, read_ndjson
+
+MENU_IMPORT_CHUNK_SIZE = 5000
+MENU_EXPORT_CHUNK_SIZE = 2000
+MENU_FIELDS = [
+    'restaurant',
+    'restaurant_address',
+    'restaurant_phone',
+    'product',
+    'category',
+    'price',
+    'special_status',
+    'description',
+    'image',
+    'availability',
+]
+MAX_PRICE = 10 ** 6
+MAX_LENGTHS = {
+    'restaurant': 50,
+    'restaurant_address': 100,
+    'restaurant_phone': 50,
+    'product': 50,
+    'category': 50,
+    'description': 200,
+    'image': 100,
+}
+TRUE_VALUES = {'1', 'true', 'yes', 'да', '+'}
+
+
+def parse_bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def parse_menu_row(row):
+    if isinstance(row, InvalidLine):
+        raise ValueError(row.error)
+    if not isinstance(row, dict):
+        raise ValueError('Ожидался объект с полями пункта меню')
+
+    restaurant = str(row.get('restaurant') or '').strip()
+    product = str(row.get('product') or '').strip()
+    if not restaurant or not product:
+        raise ValueError('Не указан ресторан или товар')
+    try:
+        price = Decimal(str(row.get('price')))
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite() or not 0 <= price < MAX_PRICE:
+        raise ValueError(f'Некорректная цена {row.get("price")!r}')
+
+    menu_row = {
+        'restaurant': restaurant,
+        'restaurant_address': str(row.get('restaurant_address') or '').strip(),
+        'restaurant_phone': str(row.get('restaurant_phone') or '').strip(),
+        'product': product,
+        'category': str(row.get('category') or '').strip(),
+        'price': price.quantize(Decimal('0.01')),
+        'special_status': parse_bool(row.get('special_status'), False),
+        'description': str(row.get('description') or ''),
+        'image': str(row.get('image') or ''),
+        'availability': parse_bool(row.get('availability'), True),
+    }
+    for field, max_length in MAX_LENGTHS.items():
+        if len(menu_row[field]) > max_length:
+            raise ValueError(f'Поле {field} длиннее {max_length} символов')
+    return menu_row
+
+
+def read_menu_rows(stream, file_format):
+    if file_format == 'csv':
+        return csv.DictReader(stream)
+    return read_ndjson(stream)
+
+
+def get_ids_by_name(model, names):
+    # Имена не уникальны, при дублях берём самую раннюю запись
+    return dict(
+        model.objects.filter(name__in=names)
+        .order_by('-id').values_list('name', 'id')
+    )
+
+
+class MenuImport:
+    def __init__(self):
+        self.category_ids = {}
+        self.restaurant_ids = {}
+        self.product_ids = {}
+        self.restaurants_to_geocode = set()
+        self.processed = 0
+        self.errors = []
+        self.created = {'restaurants': 0, 'products': 0, 'menu_items': 0}
+        self.updated = {'restaurants': 0, 'products': 0, 'menu_items': 0}
+
+    @transaction.atomic
+    def import_chunk(self, rows):
+        # Каждый ресторан и товар синхронизируем по первой встреченной строке,
+        # поэтому справочники растут с размером меню, а не файла
+        new_restaurants = {}
+        new_products = {}
+        for row in rows:
+            if row['restaurant'] not in self.restaurant_ids:
+                new_restaurants.setdefault(row['restaurant'], row)
+            product_row = new_products.get(row['product'])
+            if row['product'] not in self.product_ids \
+                    and (product_row is None or not product_row['image']):
+                new_products[row['product']] = row
+
+        self.sync_categories({
+            row['category'] for row in new_products.values() if row['category']
+        })
+        self.sync_restaurants(new_restaurants)
+        self.sync_products(new_products)
+
+        menu_rows = []
+        for row in rows:
+            if row['product'] in self.product_ids:
+                menu_rows.append(row)
+            else:
+                self.errors.append((
+                    row['number'],
+                    f'Для нового товара {row["product"]} не указана картинка',
+                ))
+        self.sync_menu_items(menu_rows)
+
+    def sync_categories(self, names):
+        names -= self.category_ids.keys()
+        if not names:
+            return
+        found_ids = get_ids_by_name(ProductCategory, names)
+        ProductCategory.objects.bulk_create([
+            ProductCategory(name=name) for name in names - found_ids.keys()
+        ])
+        self.category_ids.update(get_ids_by_name(ProductCategory, names))
+
+    def sync_restaurants(self, rows):
+        if not rows:
+            return
+        found = {
+            restaurant.name: restaurant
+            for restaurant in Restaurant.objects.filter(name__in=rows)
+            .order_by('-id').only('id', 'name', 'address', 'contact_phone')
+        }
+
+        created = []
+        changed = []
+        for name, row in rows.items():
+            restaurant = found.get(name)
+            if restaurant is None:
+                created.append(Restaurant(
+                    name=name,
+                    address=row['restaurant_address'],
+                    contact_phone=row['restaurant_phone'],
+                ))
+                continue
+            address = row['restaurant_address'] or restaurant.address
+            contact_phone = row['restaurant_phone'] or restaurant.contact_phone
+            if address == restaurant.address \
+                    and contact_phone == restaurant.contact_phone:
+                continue
+            if address != restaurant.address:
+                restaurant.latitude = restaurant.longitude = None
+                restaurant.geohash = ''
+                self.restaurants_to_geocode.add(restaurant.id)
+            restaurant.address = address
+            restaurant.contact_phone = contact_phone
+            changed.append(restaurant)
+
+        Restaurant.objects.bulk_create(created)
+        Restaurant.objects.bulk_update(changed, [
+            'address',
+            'contact_phone',
+            'latitude',
+            'longitude',
+            'geohash',
+        ])
+        self.created['restaurants'] += len(created)
+        self.updated['restaurants'] += len(changed)
+
+        self.restaurant_ids.update(get_ids_by_name(Restaurant, rows))
+        self.restaurants_to_geocode.update(
+            self.restaurant_ids[restaurant.name]
+            for restaurant in created if restaurant.address
+        )
+
+    def sync_products(self, rows):
+        if not rows:
+            return
+        found = {
+            product.name: product
+            for product in Product.objects.filter(name__in=rows).order_by('-id')
+        }
+
+        created = []
+        changed = []
+        for name, row in rows.items():
+            fields = {
+                'category_id': self.category_ids.get(row['category']),
+                'price': row['price'],
+                'special_status': row['special_status'],
+                'description': row['description'],
+                'image': row['image'],
+            }
+            product = found.get(name)
+            if product is None:
+                # Без картинки товар ломает каталог и страницу меню
+                if row['image']:
+                    created.append(Product(name=name, **fields))
+                continue
+            # Пустые поля в файле не затирают заполненные в базе
+            fields = {
+                field: value for field, value in fields.items()
+                if value not in (None, '')
+            }
+            if all(
+                getattr(product, field) == value
+                for field, value in fields.items()
+            ):
+                continue
+            for field, value in fields.items():
+                setattr(product, field, value)
+            changed.append(product)
+
+        Product.objects.bulk_create(created)
+        Product.objects.bulk_update(changed, [
+            'category',
+            'price',
+            'special_status',
+            'description',
+            'image',
+        ])
+        self.created['products'] += len(created)
+        self.updated['products'] += len(changed)
+        self.product_ids.update(get_ids_by_name(Product, rows))
+
+    def sync_menu_items(self, rows):
+        availability = {}
+        for row in rows:
+            restaurant_id = self.restaurant_ids[row['restaurant']]
+            product_id = self.product_ids[row['product']]
+            availability[restaurant_id, product_id] = row['availability']
+        found = {
+            (restaurant_id, product_id): (menu_item_id, available)
+            for menu_item_id, restaurant_id, product_id, available
+            in RestaurantMenuItem.objects.for_pairs(availability).values_list(
+                'id', 'restaurant', 'product', 'availability',
+            )
+        }
+
+        created = []
+        changed = []
+        for (restaurant_id, product_id), available in availability.items():
+            menu_item = found.get((restaurant_id, product_id))
+            if menu_item is None:
+                created.append(RestaurantMenuItem(
+                    restaurant_id=restaurant_id,
+                    product_id=product_id,
+                    availability=available,
+                ))
+            elif menu_item[1] != available:
+                changed.append(
+                    RestaurantMenuItem(id=menu_item[0], availability=available),
+                )
+
+        RestaurantMenuItem.objects.bulk_create(created, ignore_conflicts=True)
+        RestaurantMenuItem.objects.bulk_update(changed, ['availability'])
+        self.created['menu_items'] += len(created)
+        self.updated['menu_items'] += len(changed)
+
+
+def import_menu(rows, chunk_size=MENU_IMPORT_CHUNK_SIZE):
+    menu_import = MenuImport()
+    try:
+        for chunk in iterate_chunks(rows, chunk_size):
+            valid_rows = []
+            for row in chunk:
+                menu_import.processed += 1
+                try:
+                    menu_row = parse_menu_row(row)
+                except ValueError as error:
+                    menu_import.errors.append((menu_import.processed, str(error)))
+                    continue
+                menu_row['number'] = menu_import.processed
+                valid_rows.append(menu_row)
+            if valid_rows:
+                menu_import.import_chunk(valid_rows)
+            yield menu_import
+    finally:
+        # bulk-операции не отправляют сигналы, сбрасываем кэши один раз
+        # после коммита, чтобы их не перестроили по старым данным
+        transaction.on_commit(invalidate_menu_caches)
+        transaction.on_commit(invalidate_restaurant_index)
+
+
+def export_menu_rows(chunk_size=MENU_EXPORT_CHUNK_SIZE):
+    menu_items = RestaurantMenuItem.objects.order_by('restaurant', 'product')\
+        .values_list(
+            'restaurant__name',
+            'restaurant__address',
+            'restaurant__contact_phone',
+            'product__name',
+            'product__category__name',
+            'product__price',
+            'product__special_status',
+            'product__description',
+            'product__image',
+            'availability',
+        )
+    for values in menu_items.iterator(chunk_size=chunk_size):
+        row = dict(zip(MENU_FIELDS, values))
+        row['category'] = row['category'] or ''
+        yield row
+
+
+def write_menu(rows, stream, file_format):
+    if file_format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=MENU_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return
+    for row in rows:
+        row['price'] = str(row['price'])
+        stream.write(json.dumps(row, ensure_ascii=False) + '\n')
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+from address.geohash import encode
+
+
+def fill_geohash(apps, schema_editor):
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    located = Restaurant.objects.filter(
+        latitude__isnull=False,
+        longitude__isnull=False,
+    )
+    records = []
+    for record in located.iterator():
+        record.geohash = encode(record.latitude, record.longitude)
+        records.append(record)
+    Restaurant.objects.bulk_update(records, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0055_order_board_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, verbose_name='геохеш'),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0056_restaurant_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='out_of_zone',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='Вне зоны доставки'),
+        ),
+    ]
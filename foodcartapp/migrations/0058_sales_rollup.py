@@ -0,0 +1,47 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0057_order_out_of_zone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_until', models.DateTimeField(verbose_name='Учтены изменения заказов до')),
+            ],
+            options={
+                'verbose_name': 'Состояние сводок продаж',
+                'verbose_name_plural': 'Состояние сводок продаж',
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Час'), ('day', 'День'), ('month', 'Месяц')], max_length=5, verbose_name='Период')),
+                ('period_start', models.DateTimeField(verbose_name='Начало периода')),
+                ('payment', models.CharField(blank=True, choices=[('cash', 'Наличностью'), ('online', 'Электронно')], max_length=20, verbose_name='Способ оплаты')),
+                ('orders_count', models.PositiveIntegerField(verbose_name='Заказов')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Выручка')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='foodcartapp.product', verbose_name='Товар')),
+                ('restaurant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='foodcartapp.restaurant', verbose_name='Ресторан')),
+            ],
+            options={
+                'verbose_name': 'Сводка продаж',
+                'verbose_name_plural': 'Сводки продаж',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='salesrollup',
+            index=models.Index(fields=['granularity', 'period_start'], name='foodcartapp_granula_b8c04e_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+def reset_rollups(apps, schema_editor):
+    # Параллельные пересчёты могли оставить дубли и удвоенные дневные
+    # и месячные суммы, поэтому сводки строим заново: воркер без отметки
+    # пересчитает все заказы
+    SalesRollup = apps.get_model('foodcartapp', 'SalesRollup')
+    SalesRollupState = apps.get_model('foodcartapp', 'SalesRollupState')
+    SalesRollup.objects.all().delete()
+    SalesRollupState.objects.all().delete()
+    SalesRollupState.objects.create(pk=1, updated_until=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0059_sales_rollup_restaurant_set_null'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='salesrollupstate',
+            name='updated_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Учтены изменения заказов до'),
+        ),
+        migrations.RunPython(reset_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('restaurant__isnull', False)), fields=('granularity', 'period_start', 'restaurant', 'product', 'payment'), name='unique_sales_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('restaurant__isnull', True)), fields=('granularity', 'period_start', 'product', 'payment'), name='unique_unassigned_sales_rollup'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0060_sales_rollup_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Отпечаток запроса'),
+        ),
+    ]
@@ -1,12 +1,18 @@
+from collections import defaultdict
+from decimal import Decimal
+
 import requests
 from django.db import models
-from django.db.models import F, Sum
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
 from django.conf import settings
 from django.utils import timezone
 from .coordinates import fetch_coordinates
 from phonenumber_field.modelfields import PhoneNumberField
 
+from address.geohash import GeohashQuerySet, encode
+
 ORDER_STATUS = [
     ('01_created', 'Необработанный'),
     ('02_cooking', 'Готовится'),
@@ -45,6 +51,14 @@ class Restaurant(models.Model):
         null=True,
         blank=True,
     )
+    geohash = models.CharField(
+        'геохеш',
+        max_length=12,
+        blank=True,
+        db_index=True,
+    )
+
+    objects = GeohashQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'ресторан'
@@ -53,6 +67,27 @@ class Restaurant(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'address' in field_names:
+            instance._loaded_address = values[field_names.index('address')]
+        return instance
+
+    def address_changed(self, update_fields=None):
+        if self._state.adding:
+            return True
+        if update_fields is not None and 'address' not in update_fields:
+            return False
+        if not hasattr(self, '_loaded_address'):
+            # Адрес не загружали (.only(), .defer()): он меняется, только
+            # если его явно присвоили и Django сохраняет его в update_fields
+            return update_fields is not None
+        return self._loaded_address != self.address
+
+    def update_geohash(self):
+        self.geohash = encode(self.latitude, self.longitude)
+
 
 class ProductQuerySet(models.QuerySet):
     def available(self):
@@ -121,6 +156,20 @@ class Product(models.Model):
         return self.name
 
 
+class RestaurantMenuItemQuerySet(models.QuerySet):
+    def for_pairs(self, pairs):
+        products_by_restaurant = defaultdict(set)
+        for restaurant_id, product_id in pairs:
+            products_by_restaurant[restaurant_id].add(product_id)
+        if not products_by_restaurant:
+            return self.none()
+
+        pairs_filter = Q()
+        for restaurant_id, product_ids in products_by_restaurant.items():
+            pairs_filter |= Q(restaurant=restaurant_id, product__in=product_ids)
+        return self.filter(pairs_filter)
+
+
 class RestaurantMenuItem(models.Model):
     restaurant = models.ForeignKey(
         Restaurant,
@@ -140,22 +189,40 @@ class RestaurantMenuItem(models.Model):
         db_index=True
     )
 
+    objects = RestaurantMenuItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'пункт меню ресторана'
         verbose_name_plural = 'пункты меню ресторана'
         unique_together = [
             ['restaurant', 'product']
         ]
+        indexes = [
+            models.Index(fields=['product', 'availability']),
+            models.Index(fields=['restaurant', 'availability']),
+        ]
 
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
 class OrderQuerySet(models.QuerySet):
-    def with_price(self):
-        price = Sum(F('elements__product__price') * F('elements__quantity'))
-        return self.annotate(price=price).prefetch_related('elements__product')\
-            .select_related('restaurant')
+    def update_totals(self):
+        totals = (
+            OrderElement.objects
+            .filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total=Sum(F('price') * F('quantity')))
+            .values('total')
+        )
+        return self.update(
+            total=Coalesce(
+                Subquery(totals),
+                Value(Decimal(0)),
+                output_field=models.DecimalField(),
+            ),
+            updated_at=timezone.now(),
+        )
 
 
 class Order(models.Model):
@@ -204,6 +271,11 @@ class Order(models.Model):
         blank=True,
         db_index=True,
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
     payment = models.CharField(
         'Способ оплаты',
         max_length=20,
@@ -218,11 +290,26 @@ class Order(models.Model):
         null=True,
         blank=True,
     )
+    total = models.DecimalField(
+        'Стоимость',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)],
+    )
+    out_of_zone = models.BooleanField(
+        'Вне зоны доставки',
+        default=False,
+        db_index=True,
+    )
     objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['status', 'registered_at', 'id']),
+        ]
 
     def __str__(self):
         return f'{self.firstname} {self.lastname} {self.address}'
@@ -258,4 +345,128 @@ class OrderElement(models.Model):
         verbose_name_plural = 'Элементы заказа'
 
     def __str__(self):
-        return f'{self.product} {self.order}'
\ No newline at end of file
+        return f'{self.product} {self.order}'
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(expires_at__gt=timezone.now())
+
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(
+        'Ключ',
+        max_length=100,
+        unique=True,
+    )
+    order = models.ForeignKey(
+        'Order',
+        verbose_name='Заказ',
+        related_name='idempotency_keys',
+        on_delete=models.CASCADE,
+    )
+    expires_at = models.DateTimeField(
+        'Действует до',
+        db_index=True,
+    )
+    fingerprint = models.CharField(
+        'Отпечаток запроса',
+        max_length=64,
+        blank=True,
+    )
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
+
+
+ROLLUP_GRANULARITY = [
+    ('hour', 'Час'),
+    ('day', 'День'),
+    ('month', 'Месяц'),
+]
+
+
+class SalesRollup(models.Model):
+    granularity = models.CharField(
+        'Период',
+        max_length=5,
+        choices=ROLLUP_GRANULARITY,
+    )
+    period_start = models.DateTimeField('Начало периода')
+    restaurant = models.ForeignKey(
+        'Restaurant',
+        verbose_name='Ресторан',
+        related_name='sales_rollups',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    product = models.ForeignKey(
+        'Product',
+        verbose_name='Товар',
+        related_name='sales_rollups',
+        on_delete=models.CASCADE,
+    )
+    payment = models.CharField(
+        'Способ оплаты',
+        max_length=20,
+        choices=PAYMENT_METHOD,
+        blank=True,
+    )
+    orders_count = models.PositiveIntegerField('Заказов')
+    quantity = models.PositiveIntegerField('Количество')
+    revenue = models.DecimalField(
+        'Выручка',
+        max_digits=12,
+        decimal_places=2,
+    )
+
+    class Meta:
+        verbose_name = 'Сводка продаж'
+        verbose_name_plural = 'Сводки продаж'
+        indexes = [
+            models.Index(fields=['granularity', 'period_start']),
+        ]
+        # NULL в уникальном индексе не совпадает сам с собой, поэтому
+        # строки без ресторана проверяет отдельный частичный индекс
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'granularity',
+                    'period_start',
+                    'restaurant',
+                    'product',
+                    'payment',
+                ],
+                condition=Q(restaurant__isnull=False),
+                name='unique_sales_rollup',
+            ),
+            models.UniqueConstraint(
+                fields=['granularity', 'period_start', 'product', 'payment'],
+                condition=Q(restaurant__isnull=True),
+                name='unique_unassigned_sales_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.product} {self.period_start:%Y-%m-%d %H:%M}'
+
+
+class SalesRollupState(models.Model):
+    updated_until = models.DateTimeField(
+        'Учтены изменения заказов до',
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Состояние сводок продаж'
+        verbose_name_plural = 'Состояние сводок продаж'
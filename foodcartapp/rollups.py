@@ -0,0 +1,271 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Min, Max, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Order, OrderElement, SalesRollup, SalesRollupState
+from .utils import OnCommitBatch, iterate_chunks
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+# Заказ мог сохраниться с updated_at чуть раньше отметки, пока шла
+# предыдущая транзакция, поэтому берём изменения с запасом
+ROLLUP_OVERLAP = timedelta(minutes=5)
+REBUILD_WINDOW = timedelta(days=7)
+RANGES_CHUNK_SIZE = 100
+
+
+def truncate_hour(moment):
+    return moment.astimezone(dt_timezone.utc)\
+        .replace(minute=0, second=0, microsecond=0)
+
+
+def truncate_day(moment):
+    local_moment = timezone.localtime(moment)
+    return timezone.make_aware(datetime.combine(
+        local_moment.date(),
+        datetime.min.time(),
+    ))
+
+
+def truncate_month(day):
+    return truncate_day(timezone.localtime(day).replace(day=1))
+
+
+def next_month(month):
+    return truncate_month(month + timedelta(days=32))
+
+
+def merge_periods(starts, length):
+    ranges = []
+    for start in sorted(starts):
+        if ranges and ranges[-1][1] >= start:
+            ranges[-1][1] = max(ranges[-1][1], start + length)
+        else:
+            ranges.append([start, start + length])
+    return ranges
+
+
+def ranges_filter(field, ranges):
+    periods = Q()
+    for start, end in ranges:
+        periods |= Q(**{f'{field}__gte': start, f'{field}__lt': end})
+    return periods
+
+
+def lock_sales_rollups():
+    # Пересчёт удаляет строки сводок и вставляет их заново. Два параллельных
+    # пересчёта одного периода в READ COMMITTED оставили бы обе вставки,
+    # поэтому пересчёты идут по очереди. UPDATE держит блокировку строки
+    # до конца транзакции, а SQLite сразу берёт блокировку на запись
+    state = SalesRollupState.objects.filter(pk=1)
+    while not state.update(updated_until=F('updated_until')):
+        SalesRollupState.objects.get_or_create(pk=1)
+
+
+def refresh_hours(ranges):
+    # Длинный OR из диапазонов упирается в лимит глубины выражений SQLite
+    for ranges_chunk in iterate_chunks(ranges, RANGES_CHUNK_SIZE):
+        refresh_hour_ranges(ranges_chunk)
+
+
+def refresh_hour_ranges(ranges):
+    SalesRollup.objects.filter(
+        ranges_filter('period_start', ranges),
+        granularity='hour',
+    ).delete()
+
+    sales = (
+        OrderElement.objects
+        .filter(ranges_filter('order__registered_at', ranges))
+        .annotate(
+            period_start=TruncHour(
+                'order__registered_at',
+                tzinfo=dt_timezone.utc,
+            ),
+        )
+        .values(
+            'period_start',
+            'order__restaurant',
+            'product',
+            'order__payment',
+        )
+        .annotate(
+            orders_count=Count('order', distinct=True),
+            total_quantity=Sum('quantity'),
+            revenue=Sum(
+                F('price') * F('quantity'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        .order_by()
+    )
+    SalesRollup.objects.bulk_create(
+        [
+            SalesRollup(
+                granularity='hour',
+                period_start=row['period_start'],
+                restaurant_id=row['order__restaurant'],
+                product_id=row['product'],
+                payment=row['order__payment'],
+                orders_count=row['orders_count'],
+                quantity=row['total_quantity'],
+                revenue=row['revenue'],
+            )
+            for row in sales.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+def refresh_rollups(granularity, period_start, period_end, source):
+    SalesRollup.objects.filter(
+        granularity=granularity,
+        period_start=period_start,
+    ).delete()
+    sales = (
+        SalesRollup.objects
+        .filter(
+            granularity=source,
+            period_start__gte=period_start,
+            period_start__lt=period_end,
+        )
+        .values('restaurant', 'product', 'payment')
+        .annotate(
+            total_orders=Sum('orders_count'),
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum('revenue'),
+        )
+        .order_by()
+    )
+    SalesRollup.objects.bulk_create(
+        [
+            SalesRollup(
+                granularity=granularity,
+                period_start=period_start,
+                restaurant_id=row['restaurant'],
+                product_id=row['product'],
+                payment=row['payment'],
+                orders_count=row['total_orders'],
+                quantity=row['total_quantity'],
+                revenue=row['total_revenue'],
+            )
+            for row in sales
+        ],
+        batch_size=1000,
+    )
+
+
+def refresh_days(days):
+    # Дневные и месячные сводки складываем из более мелких,
+    # исходные заказы не перечитываем
+    for day in sorted(days):
+        refresh_rollups('day', day, day + DAY, source='hour')
+    for month in sorted({truncate_month(day) for day in days}):
+        refresh_rollups('month', month, next_month(month), source='day')
+
+
+@transaction.atomic
+def refresh_hour_periods(hours):
+    lock_sales_rollups()
+    refresh_hours(merge_periods(hours, HOUR))
+    refresh_days({truncate_day(hour) for hour in hours})
+
+
+def refresh_periods(moments):
+    refresh_hour_periods({truncate_hour(moment) for moment in moments})
+
+
+@OnCommitBatch
+def refresh_hour_periods_on_commit(hours):
+    refresh_hour_periods(hours)
+
+
+def refresh_periods_on_commit(moments):
+    # Массовое удаление шлёт сигнал на каждый заказ: копим часы
+    # за транзакцию и пересчитываем каждый час один раз
+    refresh_hour_periods_on_commit.add(
+        truncate_hour(moment) for moment in moments
+    )
+
+
+def select_rollups(period_start, period_end):
+    # Целые месяцы берём из месячных сводок, края периода — из дневных
+    months_start = truncate_month(period_start)
+    if months_start < period_start:
+        months_start = next_month(months_start)
+    months_end = months_start
+    while next_month(months_end) <= period_end:
+        months_end = next_month(months_end)
+    if months_end == months_start:
+        return SalesRollup.objects.filter(
+            granularity='day',
+            period_start__gte=period_start,
+            period_start__lt=period_end,
+        )
+    return SalesRollup.objects.filter(
+        Q(
+            granularity='month',
+            period_start__gte=months_start,
+            period_start__lt=months_end,
+        )
+        | Q(
+            granularity='day',
+            period_start__gte=period_start,
+            period_start__lt=months_start,
+        )
+        | Q(
+            granularity='day',
+            period_start__gte=months_end,
+            period_start__lt=period_end,
+        )
+    )
+
+
+@transaction.atomic
+def update_sales_rollups():
+    started_at = timezone.now()
+    lock_sales_rollups()
+    state = SalesRollupState.objects.get(pk=1)
+    orders = Order.objects.all()
+    if state.updated_until:
+        orders = orders.filter(
+            updated_at__gt=state.updated_until - ROLLUP_OVERLAP,
+        )
+    hours = {
+        truncate_hour(registered_at)
+        for registered_at in orders.values_list('registered_at', flat=True)
+        .iterator()
+    }
+    refresh_hour_periods(hours)
+    state.updated_until = started_at
+    state.save()
+    return len(hours)
+
+
+def rebuild_sales_rollups(window=REBUILD_WINDOW):
+    started_at = timezone.now()
+    period = Order.objects.aggregate(
+        first=Min('registered_at'),
+        last=Max('registered_at'),
+    )
+    with transaction.atomic():
+        lock_sales_rollups()
+        SalesRollup.objects.all().delete()
+    if period['first'] is not None:
+        start = truncate_day(period['first'])
+        while start <= period['last']:
+            end = start + window
+            with transaction.atomic():
+                lock_sales_rollups()
+                refresh_hours([[start, end]])
+                refresh_days({
+                    start + DAY * offset for offset in range(window.days)
+                })
+            yield start, end
+            start = end
+    with transaction.atomic():
+        lock_sales_rollups()
+        SalesRollupState.objects.filter(pk=1).update(updated_until=started_at)
@@ -1,14 +1,23 @@
 from django.conf import settings
-from django.db import transaction
-import requests
-from rest_framework.serializers import ModelSerializer
+from django.db import connection, transaction
+from rest_framework.serializers import IntegerField, ModelSerializer
+from rest_framework.serializers import ValidationError
 
-from .models import OrderElement, Order
+from .delivery import can_deliver
+from .menu import get_menu_index
+from .models import OrderElement, Order, Product
+from .signals import orders_created
 from address.models import Address
-from address.coordinates import fetch_coordinates
+
+
+def calculate_total(products):
+    return sum(
+        fields['product'].price * fields['quantity'] for fields in products
+    )
 
 
 class ProductSerializer(ModelSerializer):
+    product = IntegerField()
 
     class Meta:
         model = OrderElement
@@ -32,6 +41,47 @@ class OrderSerializer(ModelSerializer):
             'products',
         ]
 
+    def validate_products(self, products):
+        product_ids = {fields['product'] for fields in products}
+        found_products = self.context.get('products')
+        if found_products is None:
+            found_products = Product.objects.in_bulk(product_ids)
+        missing_ids = product_ids - found_products.keys()
+        if missing_ids:
+            raise ValidationError(
+                f'Недопустимые первичные ключи {sorted(missing_ids)}'
+            )
+
+        menu_index = get_menu_index()
+        unavailable_ids = {
+            product_id for product_id in product_ids
+            if not menu_index.restaurants.get(product_id)
+        }
+        if unavailable_ids:
+            raise ValidationError(
+                f'Товары {sorted(unavailable_ids)} сейчас не в продаже'
+            )
+
+        return [
+            {**fields, 'product': found_products[fields['product']]}
+            for fields in products
+        ]
+
+    def validate(self, attrs):
+        if settings.DELIVERY_ZONE_CHECK not in ('reject', 'flag'):
+            return attrs
+        deliverable = can_deliver(
+            attrs['address'],
+            [fields['product'].id for fields in attrs['products']],
+        )
+        if deliverable is not False:
+            return attrs
+        if settings.DELIVERY_ZONE_CHECK == 'reject':
+            raise ValidationError({
+                'address': 'Ни один ресторан в зоне доставки не может выполнить заказ',
+            })
+        return {**attrs, 'out_of_zone': True}
+
     @transaction.atomic
     def create(self, validated_data):
         order = Order.objects.create(
@@ -39,6 +89,8 @@ class OrderSerializer(ModelSerializer):
             firstname=validated_data['firstname'],
             lastname=validated_data['lastname'],
             phonenumber=validated_data['phonenumber'],
+            total=calculate_total(validated_data['products']),
+            out_of_zone=validated_data.get('out_of_zone', False),
         )
 
         products = validated_data['products']
@@ -46,18 +98,54 @@ class OrderSerializer(ModelSerializer):
             order=order, price=fields['product'].price, **fields
         ) for fields in products]
         OrderElement.objects.bulk_create(elements)
+        return order
 
-        api_key = settings.YANDEX_GEO_APIKEY
-        address, status = Address.objects.get_or_create(
+
+def insert_orders(orders):
+    if connection.features.can_return_rows_from_bulk_insert:
+        Order.objects.bulk_create(orders)
+    elif connection.vendor == 'sqlite':
+        Order.objects.bulk_create(orders)
+        # SQLite не вернёт id из bulk_create, но до конца транзакции
+        # держит блокировку записи и выдаёт id по возрастанию, поэтому
+        # только что вставленные заказы — последние по id
+        order_ids = list(
+            Order.objects.order_by('-id')
+            .values_list('id', flat=True)[:len(orders)]
+        )
+        for order, order_id in zip(orders, reversed(order_ids)):
+            order.id = order_id
+    else:
+        # На остальных базах без RETURNING id узнаём только поштучно
+        for order in orders:
+            order.save()
+
+
+@transaction.atomic
+def bulk_create_orders(validated_orders):
+    if not validated_orders:
+        return []
+    orders = [
+        Order(
             address=validated_data['address'],
+            firstname=validated_data['firstname'],
+            lastname=validated_data['lastname'],
+            phonenumber=validated_data['phonenumber'],
+            total=calculate_total(validated_data['products']),
+            out_of_zone=validated_data.get('out_of_zone', False),
         )
-        if not address.latitude or not address.longitude:
-            try:
-                address.latitude, address.longitude = fetch_coordinates(
-                    api_key,
-                    validated_data['address'],
-                )
-            except (requests.exceptions.HTTPError, KeyError) as err:
-                pass
-            address.save()
-        return order
\ No newline at end of file
+        for validated_data in validated_orders
+    ]
+    insert_orders(orders)
+
+    elements = [
+        OrderElement(order=order, price=fields['product'].price, **fields)
+        for order, validated_data in zip(orders, validated_orders)
+        for fields in validated_data['products']
+    ]
+    OrderElement.objects.bulk_create(elements)
+    # bulk_create не отправляет post_save: ставим адреса в очередь
+    # и будим доску заказов сами, один раз на пачку
+    Address.objects.enqueue(order.address for order in orders)
+    orders_created.send(sender=Order, orders=orders)
+    return orders
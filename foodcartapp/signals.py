@@ -1,35 +1,113 @@
-from django.conf import settings
+from django.db import transaction
 from django.db.models.signals import pre_save, post_save
-from django.dispatch import receiver
-import requests
+from django.db.models.signals import pre_delete, post_delete
+from django.dispatch import Signal, receiver
 
-from foodcartapp.models import Restaurant, Order
-from address.coordinates import fetch_coordinates
+from foodcartapp.models import Restaurant, Order, OrderElement
+from foodcartapp.models import RestaurantMenuItem
+from foodcartapp.models import Product, ProductCategory
+from foodcartapp.availability import invalidate_availability_matrix
+from foodcartapp.availability import invalidate_menu_caches
+from foodcartapp.catalog import invalidate_catalog
+from foodcartapp.rollups import lock_sales_rollups, refresh_hour_periods
+from foodcartapp.rollups import refresh_periods_on_commit
+from foodcartapp.spatial import invalidate_restaurant_index
+from foodcartapp.utils import OnCommitBatch
+from address.geocoding import get_coordinates
 from address.models import Address
 
+# Заказы, созданные bulk_create: post_save для них не приходит
+orders_created = Signal()
+
 
 @receiver(pre_save, sender=Restaurant)
-def get_restaurant_coordinates(sender, instance, **kwargs):
-    api_key = settings.YANDEX_GEO_APIKEY
-    try:
-        instance.latitude, instance.longitude = fetch_coordinates(
-            api_key,
-            instance.address,
+def get_restaurant_coordinates(sender, instance, update_fields=None,
+                               **kwargs):
+    if not instance.address_changed(update_fields):
+        return
+    coordinates = get_coordinates(instance.address)
+    instance.latitude, instance.longitude = coordinates or (None, None)
+    if update_fields is not None and 'latitude' not in update_fields:
+        # Сохраняют только часть полей, и координаты в неё не входят
+        instance.update_geohash()
+        Restaurant.objects.filter(pk=instance.pk).update(
+            latitude=instance.latitude,
+            longitude=instance.longitude,
+            geohash=instance.geohash,
         )
-    except (requests.exceptions.HTTPError, KeyError) as err:
-        pass
+
+
+@receiver(pre_save, sender=Restaurant)
+def update_restaurant_geohash(sender, instance, **kwargs):
+    if {'latitude', 'longitude'} & instance.get_deferred_fields():
+        return
+    instance.update_geohash()
+
+
+@receiver(post_save, sender=Restaurant)
+def remember_restaurant_address(sender, instance, **kwargs):
+    instance._loaded_address = instance.address
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def reset_restaurant_index(sender, **kwargs):
+    transaction.on_commit(invalidate_restaurant_index)
+    transaction.on_commit(invalidate_availability_matrix)
+
+
+@receiver(pre_delete, sender=Restaurant)
+def detach_restaurant_sales(sender, instance, **kwargs):
+    lock_sales_rollups()
+    hour_rollups = instance.sales_rollups.filter(granularity='hour')
+    instance._sales_hours = set(
+        hour_rollups.values_list('period_start', flat=True),
+    )
+    instance.sales_rollups.all().delete()
+
+
+@receiver(post_delete, sender=Restaurant)
+def refresh_restaurant_sales(sender, instance, **kwargs):
+    # Заказы удалённого ресторана остаются без ресторана, и его продажи
+    # пересчитываем туда же, чтобы отчёт не потерял выручку
+    refresh_hour_periods(instance._sales_hours)
 
 
 @receiver(post_save, sender=Order)
-def update_order_coordinates(sender, instance, **kwargs):
-    api_key = settings.YANDEX_GEO_APIKEY
-    address, created = Address.objects.get_or_create(address=instance.address)
-    if created:
-        try:
-            address.latitude, address.longitude = fetch_coordinates(
-                api_key,
-                instance.address,
-            )
-        except (requests.exceptions.HTTPError, KeyError) as err:
-            pass
-        address.save()
\ No newline at end of file
+def enqueue_order_address(sender, instance, **kwargs):
+    Address.objects.enqueue([instance.address])
+
+
+@receiver(post_delete, sender=Order)
+def refresh_order_sales(sender, instance, **kwargs):
+    # Удалённый заказ не оставит следа в updated_at, пересчитываем сразу
+    refresh_periods_on_commit([instance.registered_at])
+
+
+@OnCommitBatch
+def update_totals_on_commit(order_ids):
+    Order.objects.filter(pk__in=order_ids).update_totals()
+
+
+@receiver(post_save, sender=OrderElement)
+@receiver(post_delete, sender=OrderElement)
+def update_order_total(sender, instance, **kwargs):
+    # Позиции сохраняют и удаляют пачками, а при удалении заказа — каскадом:
+    # пересчитываем каждый заказ один раз после коммита
+    update_totals_on_commit.add([instance.order_id])
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def reset_menu_index(sender, **kwargs):
+    # До коммита параллельный запрос перестроил бы индекс по старым данным
+    transaction.on_commit(invalidate_menu_caches)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def reset_catalog(sender, **kwargs):
+    transaction.on_commit(invalidate_availability_matrix)
+    transaction.on_commit(invalidate_catalog)
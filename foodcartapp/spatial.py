@@ -0,0 +1,116 @@
+import numpy as np
+from geopy import distance
+from scipy.spatial import cKDTree
+
+from .distances import EARTH_RADIUS_KM
+from .models import Restaurant
+from .utils import VersionedCache
+
+RESTAURANT_INDEX_CACHE_KEY = 'foodcartapp:restaurant_index'
+GEODESIC_MARGIN = 0.01
+
+
+def to_unit_vectors(coordinates):
+    lat, lon = np.radians(np.asarray(coordinates, dtype=float).reshape(-1, 2)).T
+    return np.column_stack([
+        np.cos(lat) * np.cos(lon),
+        np.cos(lat) * np.sin(lon),
+        np.sin(lat),
+    ])
+
+
+def chord_to_km(chord):
+    # Длина хорды единичной сферы монотонна по расстоянию по поверхности,
+    # поэтому дерево ищет соседей в трёхмерных координатах
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+class RestaurantIndex:
+    def __init__(self, restaurants):
+        self.names = {}
+        located = []
+        for restaurant in restaurants:
+            self.names[restaurant.id] = restaurant.name
+            if restaurant.latitude is not None and restaurant.longitude is not None:
+                located.append(
+                    (restaurant.id, restaurant.latitude, restaurant.longitude),
+                )
+
+        self.ids = np.array(
+            [restaurant_id for restaurant_id, lat, lon in located],
+            dtype=int,
+        )
+        self.coordinates = np.array(
+            [(lat, lon) for restaurant_id, lat, lon in located],
+            dtype=float,
+        ).reshape(-1, 2)
+        self.tree = cKDTree(to_unit_vectors(self.coordinates))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, lat, lon, k):
+        k = min(k, len(self))
+        if not k:
+            return np.array([], dtype=int), np.array([])
+        chords, positions = self.tree.query(to_unit_vectors([(lat, lon)])[0], k)
+        return np.atleast_1d(positions), chord_to_km(np.atleast_1d(chords))
+
+    def search(self, lat, lon, k, restricted_to=None):
+        if restricted_to is None:
+            return self.query(lat, lon, k)
+
+        wanted = min(k, np.isin(self.ids, restricted_to).sum())
+        # Расширяем поиск, пока не наберём k подходящих ресторанов
+        limit = k
+        while True:
+            positions, distances = self.query(lat, lon, limit)
+            allowed = np.isin(self.ids[positions], restricted_to)
+            if allowed.sum() >= wanted:
+                return positions[allowed][:k], distances[allowed][:k]
+            limit *= 2
+
+    def nearest(self, lat, lon, k=1, restricted_to=None, geodesic=False):
+        if restricted_to is not None:
+            restricted_to = np.fromiter(restricted_to, dtype=int)
+        positions, distances = self.search(lat, lon, k, restricted_to)
+
+        if geodesic and len(positions):
+            # На эллипсоиде порядок может отличаться от сферы на доли процента,
+            # поэтому добираем кандидатов с небольшим запасом
+            margin = distances[-1] * (1 + GEODESIC_MARGIN)
+            limit = k
+            while len(positions) == limit and distances[-1] <= margin:
+                limit *= 2
+                positions, distances = self.search(lat, lon, limit, restricted_to)
+            distances = np.array([
+                distance.distance((lat, lon), self.coordinates[position]).km
+                for position in positions
+            ])
+            order = np.argsort(distances, kind='stable')[:k]
+            positions, distances = positions[order], distances[order]
+
+        return [
+            (int(restaurant_id), float(km))
+            for restaurant_id, km in zip(self.ids[positions], distances)
+        ]
+
+
+def build_restaurant_index():
+    return RestaurantIndex(
+        Restaurant.objects.only('id', 'name', 'latitude', 'longitude'),
+    )
+
+
+restaurant_index_cache = VersionedCache(
+    RESTAURANT_INDEX_CACHE_KEY,
+    build_restaurant_index,
+)
+
+
+def get_restaurant_index():
+    return restaurant_index_cache.get()
+
+
+def invalidate_restaurant_index():
+    restaurant_index_cache.invalidate()
@@ -0,0 +1,1023 @@
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.test import Client, SimpleTestCase, TestCase
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from geopy import distance
+import requests
+
+from address.geocoding import memory_cache
+from address.models import Address
+from .assignment import ASSIGNMENT_MODES, assign_matching
+from .availability import select_menu_items, set_availability
+from .catalog import get_catalog
+from .delivery import can_deliver
+from .menu import get_menu_index
+from .menu_transfer import import_menu, read_menu_rows
+from .models import IdempotencyKey, Order, OrderElement, Product
+from .models import Restaurant, RestaurantMenuItem, SalesRollup
+from .rollups import refresh_hour_periods, refresh_periods, truncate_hour
+from .rollups import update_sales_rollups
+from .spatial import RestaurantIndex
+from .utils import VersionedCache
+
+# Выборка товаров, вставки заказа, адреса в очередь и всех позиций разом,
+# а также SAVEPOINT и RELEASE: внутри теста транзакция сериализатора вложенная
+ORDER_QUERIES = 6
+# Выборка товаров, SAVEPOINT, вставка заказов, их id, вставка позиций,
+# адреса в очередь и RELEASE — на пачку, а не на каждый заказ
+BULK_ORDER_QUERIES = 7
+
+# Тесты чистят кэш, поэтому работают со своим, а не с общим кэшем сайта
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+
+def slow_fetch_coordinates(apikey, address):
+    time.sleep(0.5)
+    return '55.75', '37.61'
+
+
+class OrderApiMixin:
+    def setUp(self):
+        cache.clear()
+        self.restaurant = Restaurant.objects.create(name='Ресторан')
+        self.products = [
+            Product.objects.create(
+                name=f'Товар {number}',
+                price=100 + number,
+                image='burger.jpg',
+            )
+            for number in range(50)
+        ]
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=self.restaurant, product=product)
+            for product in self.products
+        ])
+        cache.clear()
+
+    def order_payload(self, products):
+        return {
+            'address': 'Москва, Тверская, 1',
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79001234567',
+            'products': [
+                {'product': product.id, 'quantity': 1} for product in products
+            ],
+        }
+
+    def post_order(self, products, client=None, **headers):
+        return (client or self.client).post(
+            '/api/order/',
+            self.order_payload(products),
+            content_type='application/json',
+            **headers,
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RegisterOrderTests(OrderApiMixin, TestCase):
+    def test_checkout_does_not_wait_for_geocoder(self):
+        with mock.patch(
+            'address.coordinates.fetch_coordinates',
+            side_effect=slow_fetch_coordinates,
+        ) as fetch, mock.patch(
+            'address.geocoding.fetch_coordinates',
+            side_effect=slow_fetch_coordinates,
+        ) as imported_fetch:
+            started_at = time.monotonic()
+            response = self.post_order(self.products[:3])
+            elapsed = time.monotonic() - started_at
+
+        self.assertEqual(response.status_code, 201)
+        fetch.assert_not_called()
+        imported_fetch.assert_not_called()
+        self.assertLess(elapsed, 0.5)
+        # Адрес только поставлен в очередь геокодирования
+        address = Address.objects.get()
+        self.assertEqual(address.address, 'москва, тверская, 1')
+        self.assertIsNone(address.latitude)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_order_query_count_does_not_grow_with_cart(self):
+        get_menu_index()
+        for products in [self.products[:1], self.products]:
+            with self.subTest(cart_size=len(products)):
+                with self.assertNumQueries(ORDER_QUERIES):
+                    response = self.post_order(products)
+                self.assertEqual(response.status_code, 201)
+                order = Order.objects.get(pk=response.data['id'])
+                self.assertEqual(order.elements.count(), len(products))
+                self.assertEqual(
+                    order.total,
+                    sum(product.price for product in products),
+                )
+
+    def test_too_long_idempotency_key_is_rejected(self):
+        with self.assertNumQueries(0):
+            response = self.post_order(
+                self.products[:1],
+                HTTP_IDEMPOTENCY_KEY='k' * 101,
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+        response = self.post_order(
+            self.products[:1],
+            HTTP_IDEMPOTENCY_KEY='k' * 100,
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_idempotency_key_is_bound_to_request(self):
+        response = self.post_order(
+            self.products[:2],
+            HTTP_IDEMPOTENCY_KEY='checkout-1',
+        )
+        self.assertEqual(response.status_code, 201)
+
+        replayed = self.post_order(
+            self.products[:2],
+            HTTP_IDEMPOTENCY_KEY='checkout-1',
+        )
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.data['id'], response.data['id'])
+
+        changed_cart = self.post_order(
+            self.products[:3],
+            HTTP_IDEMPOTENCY_KEY='checkout-1',
+        )
+        self.assertEqual(changed_cart.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkOrderTests(OrderApiMixin, TestCase):
+    def post_ndjson(self, content):
+        return self.client.post(
+            '/api/orders/bulk/',
+            content,
+            content_type='application/x-ndjson',
+        )
+
+    def test_ndjson_orders_are_created_per_chunk(self):
+        get_menu_index()
+        for orders_count in [3, 30]:
+            Order.objects.all().delete()
+            lines = [
+                json.dumps(self.order_payload(self.products[:number % 5 + 1]))
+                for number in range(orders_count)
+            ]
+            lines.insert(1, '{не json')
+            with self.subTest(orders_count=orders_count):
+                with self.captureOnCommitCallbacks() as callbacks, \
+                        self.assertNumQueries(BULK_ORDER_QUERIES):
+                    response = self.post_ndjson('\n'.join(lines))
+
+                self.assertEqual(response.status_code, 200)
+                results = response.json()['results']
+                self.assertEqual(len(results), orders_count + 1)
+                self.assertIn('errors', results[1])
+                order_ids = [result['id'] for result in results if 'id' in result]
+                self.assertEqual(len(order_ids), orders_count)
+                orders = Order.objects.in_bulk(order_ids)
+                for number, order_id in enumerate(order_ids):
+                    products = self.products[:number % 5 + 1]
+                    self.assertEqual(orders[order_id].elements.count(), len(products))
+                    self.assertEqual(
+                        orders[order_id].total,
+                        sum(product.price for product in products),
+                    )
+                self.assertTrue(
+                    Address.objects.filter(address='москва, тверская, 1').exists(),
+                )
+                # Доску заказов будим один раз на пачку
+                self.assertEqual(len(callbacks), 1)
+
+    def test_empty_ndjson_body_is_rejected(self):
+        for content in ['', '\n\n']:
+            with self.subTest(content=content):
+                response = self.post_ndjson(content)
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES, DELIVERY_RADIUS_KM=5)
+class DeliveryZoneTests(OrderApiMixin, TestCase):
+    NEAR = 'Москва, Тверская, 1'
+    FAR = 'Сергиев Посад, Вокзальная, 1'
+    NOT_GEOCODED = 'Москва, Новая, 1'
+
+    def setUp(self):
+        super().setUp()
+        Restaurant.objects.filter(pk=self.restaurant.pk)\
+            .update(latitude=55.75, longitude=37.61)
+        Address.objects.create(
+            address='москва, тверская, 1', latitude=55.76, longitude=37.61,
+        )
+        Address.objects.create(
+            address='сергиев посад, вокзальная, 1',
+            latitude=56.31,
+            longitude=38.13,
+        )
+        memory_cache.clear()
+        self.addCleanup(memory_cache.clear)
+        cache.clear()
+        patcher = mock.patch('address.geocoding.fetch_coordinates')
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_to(self, address):
+        return self.client.post(
+            '/api/order/',
+            {**self.order_payload(self.products[:2]), 'address': address},
+            content_type='application/json',
+        )
+
+    def test_can_deliver(self):
+        product_ids = [product.id for product in self.products[:2]]
+        self.assertIs(can_deliver(self.NEAR, product_ids), True)
+        self.assertIs(can_deliver(self.FAR, product_ids), False)
+        # Адрес ещё не геокодирован: не отказываем и геокодер не зовём
+        self.assertIsNone(can_deliver(self.NOT_GEOCODED, product_ids))
+        self.fetch.assert_not_called()
+
+    @override_settings(DELIVERY_ZONE_CHECK='reject')
+    def test_reject_mode(self):
+        response = self.post_to(self.FAR)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('address', response.json())
+        self.assertFalse(Order.objects.exists())
+
+        for address in [self.NEAR, self.NOT_GEOCODED]:
+            with self.subTest(address=address):
+                response = self.post_to(address)
+                self.assertEqual(response.status_code, 201)
+                self.assertFalse(
+                    Order.objects.get(pk=response.json()['id']).out_of_zone,
+                )
+        self.fetch.assert_not_called()
+
+    @override_settings(DELIVERY_ZONE_CHECK='flag')
+    def test_flag_mode(self):
+        response = self.post_to(self.FAR)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Order.objects.get(pk=response.json()['id']).out_of_zone)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ConcurrentReplayTests(OrderApiMixin, TransactionTestCase):
+    THREADS = 8
+
+    def post_order_in_thread(self, barrier, responses):
+        try:
+            client = Client()
+            barrier.wait()
+            responses.append(self.post_order(
+                self.products[:2],
+                client=client,
+                HTTP_IDEMPOTENCY_KEY='checkout-1',
+            ))
+        finally:
+            connection.close()
+
+    def test_same_key_from_parallel_requests_creates_one_order(self):
+        barrier = threading.Barrier(self.THREADS)
+        responses = []
+        threads = [
+            threading.Thread(
+                target=self.post_order_in_thread,
+                args=(barrier, responses),
+            )
+            for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(responses), self.THREADS)
+        self.assertEqual(
+            {response.status_code for response in responses},
+            {201},
+        )
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+        order = Order.objects.get()
+        self.assertEqual(
+            {response.json()['id'] for response in responses},
+            {order.id},
+        )
+
+
+class RestaurantIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.random = random.Random(18)
+        self.restaurants = [
+            Restaurant(
+                id=restaurant_id,
+                name=f'Ресторан {restaurant_id}',
+                latitude=self.random.uniform(55.5, 56.0),
+                longitude=self.random.uniform(37.3, 37.9),
+            )
+            for restaurant_id in range(1, 201)
+        ]
+        self.restaurants.append(Restaurant(id=201, name='Без координат'))
+        self.index = RestaurantIndex(self.restaurants)
+
+    def brute_force_nearest(self, lat, lon, k, restricted_to=None):
+        restaurants_with_distances = sorted(
+            (
+                distance.distance(
+                    (lat, lon),
+                    (restaurant.latitude, restaurant.longitude),
+                ).km,
+                restaurant.id,
+            )
+            for restaurant in self.restaurants
+            if restaurant.latitude is not None
+            and (restricted_to is None or restaurant.id in restricted_to)
+        )
+        return restaurants_with_distances[:k]
+
+    def test_geodesic_ranking_matches_brute_force(self):
+        for query in range(100):
+            lat = self.random.uniform(55.5, 56.0)
+            lon = self.random.uniform(37.3, 37.9)
+            restricted_to = None
+            if query % 2:
+                restricted_to = set(self.random.sample(range(1, 202), 30))
+            with self.subTest(lat=lat, lon=lon, restricted=bool(restricted_to)):
+                expected = self.brute_force_nearest(lat, lon, 5, restricted_to)
+                found = self.index.nearest(
+                    lat,
+                    lon,
+                    k=5,
+                    restricted_to=restricted_to,
+                    geodesic=True,
+                )
+                self.assertEqual(
+                    [restaurant_id for restaurant_id, km in found],
+                    [restaurant_id for km, restaurant_id in expected],
+                )
+                for (restaurant_id, km), (expected_km, _) in zip(found, expected):
+                    self.assertAlmostEqual(km, expected_km, places=6)
+
+    def test_spherical_distances_are_close_to_geodesic(self):
+        lat, lon = 55.75, 37.61
+        found = self.index.nearest(lat, lon, k=10)
+        expected = self.brute_force_nearest(lat, lon, 10)
+        for (restaurant_id, km), (expected_km, _) in zip(found, expected):
+            self.assertAlmostEqual(km, expected_km, delta=expected_km * 0.005)
+
+    def test_restaurants_without_coordinates_are_skipped(self):
+        found = self.index.nearest(55.75, 37.61, k=3, restricted_to={201, 7})
+        self.assertEqual([restaurant_id for restaurant_id, km in found], [7])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VersionedCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return {'build': self.builds}
+
+    def test_process_rereads_index_only_after_invalidation(self):
+        index_cache = VersionedCache('tests:index', self.build)
+        index = index_cache.get()
+
+        with mock.patch('foodcartapp.utils.cache', wraps=cache) as shared:
+            self.assertIs(index_cache.get(), index)
+        shared.get.assert_called_once_with('tests:index:version')
+
+        other_process = VersionedCache('tests:index', self.build)
+        self.assertEqual(other_process.get(), {'build': 1})
+
+        other_process.invalidate()
+        self.assertEqual(index_cache.get(), {'build': 2})
+        self.assertEqual(other_process.get(), {'build': 2})
+        self.assertEqual(self.builds, 2)
+
+        cache.clear()
+        self.assertEqual(index_cache.get(), {'build': 3})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AvailabilityTests(TestCase):
+    def test_menu_caches_are_reset_after_commit(self):
+        restaurant = Restaurant.objects.create(name='Ресторан')
+        product = Product.objects.create(
+            name='Бургер',
+            price=300,
+            image='burger.jpg',
+        )
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        cache.clear()
+        self.assertIn(product.id, get_menu_index().restaurants)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            updated = set_availability(
+                select_menu_items(restaurants=[restaurant]),
+                False,
+            )
+            self.assertEqual(updated, 1)
+            self.assertIn(product.id, get_menu_index().restaurants)
+
+        self.assertNotIn(product.id, get_menu_index().restaurants)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AssignRestaurantsTests(TestCase):
+    def setUp(self):
+        # bulk_create не отправляет сигналы, поэтому геокодер не вызывается
+        Restaurant.objects.bulk_create([
+            Restaurant(name='Западный', latitude=55.75, longitude=37.60),
+            Restaurant(name='Восточный', latitude=55.75, longitude=37.70),
+        ])
+        self.west, self.east = Restaurant.objects.order_by('id')
+        self.product = Product.objects.create(
+            name='Бургер',
+            price=300,
+            image='burger.jpg',
+        )
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=restaurant, product=self.product)
+            for restaurant in [self.west, self.east]
+        ])
+        cache.clear()
+
+    def create_order(self, longitude, restaurant=None):
+        address = f'Москва, точка {longitude}'
+        order = Order.objects.create(
+            address=address,
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            payment='cash',
+            restaurant=restaurant,
+        )
+        OrderElement.objects.create(
+            order=order,
+            product=self.product,
+            price=self.product.price,
+        )
+        Address.objects.filter(address=address.lower()).update(
+            latitude=55.75,
+            longitude=longitude,
+        )
+        return order
+
+    def assign(self, mode, capacity=1):
+        stdout = io.StringIO()
+        call_command(
+            'assign_restaurants',
+            mode=mode,
+            capacity=capacity,
+            stdout=stdout,
+        )
+        return stdout.getvalue()
+
+    def test_matching_minimizes_total_distance(self):
+        # Жадный алгоритм отдал бы западный ресторан первому заказу,
+        # и второму пришлось бы ехать с востока через весь город
+        middle = self.create_order(37.64)
+        far_west = self.create_order(37.55)
+
+        output = self.assign('matching')
+
+        middle.refresh_from_db()
+        far_west.refresh_from_db()
+        self.assertEqual(middle.restaurant, self.east)
+        self.assertEqual(far_west.restaurant, self.west)
+        self.assertIn('Назначено 2 из 2 заказов', output)
+
+    def test_orders_assigned_by_manager_are_left_alone(self):
+        assigned = self.create_order(37.70, restaurant=self.west)
+        late = self.create_order(37.60)
+        at_restaurant = self.create_order(37.70)
+
+        def assign_after_manager(costs, capacities):
+            # Менеджер назначает ресторан, пока команда считает
+            Order.objects.filter(pk=late.pk).update(restaurant=self.east)
+            return assign_matching(costs, capacities)
+
+        with mock.patch.dict(ASSIGNMENT_MODES, matching=assign_after_manager):
+            output = self.assign('matching', capacity=2)
+
+        for order in [assigned, late, at_restaurant]:
+            order.refresh_from_db()
+        self.assertEqual(assigned.restaurant, self.west)
+        self.assertEqual(late.restaurant, self.east)
+        self.assertEqual(at_restaurant.restaurant, self.east)
+        self.assertIn('Пропущено 1 заказов', output)
+        self.assertIn(str(late.pk), output)
+        self.assertNotIn('inf', output)
+        self.assertNotIn('nan', output)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogTests(OrderApiMixin, TestCase):
+    def test_catalog_is_fetched_once_per_request(self):
+        with mock.patch(
+            'foodcartapp.views.get_catalog',
+            wraps=get_catalog,
+        ) as fetch_catalog:
+            response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        fetch_catalog.assert_called_once_with()
+        self.assertEqual(
+            response['ETag'],
+            f'"{hashlib.sha1(response.content).hexdigest()}"',
+        )
+        self.assertEqual(len(response.json()), len(self.products))
+
+        response = self.client.get(
+            '/api/products/',
+            HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RestaurantGeocodingTests(TestCase):
+    def setUp(self):
+        # bulk_create не отправляет сигналы, поэтому геокодер не вызывается
+        Restaurant.objects.bulk_create([
+            Restaurant(
+                name=f'Ресторан {number}',
+                address=f'Москва, Арбат, {number}',
+                latitude=55.75,
+                longitude=37.59,
+            )
+            for number in range(20)
+        ])
+
+    def test_unchanged_addresses_are_not_geocoded(self):
+        with mock.patch(
+            'address.geocoding.fetch_coordinates',
+            side_effect=slow_fetch_coordinates,
+        ) as fetch:
+            for restaurant in Restaurant.objects.all():
+                restaurant.contact_phone = '+79001234567'
+                restaurant.save()
+            for restaurant in Restaurant.objects.only('id', 'name'):
+                restaurant.name += '!'
+                restaurant.save()
+            for restaurant in Restaurant.objects.all():
+                restaurant.address = 'Москва, Новый Арбат, 1'
+                restaurant.save(update_fields=['name'])
+        fetch.assert_not_called()
+        self.assertEqual(
+            Restaurant.objects.filter(address__startswith='Москва, Арбат').count(),
+            20,
+        )
+
+    def test_changed_address_is_geocoded(self):
+        restaurant = Restaurant.objects.only('id').first()
+        restaurant.address = 'Москва, Никольская, 10'
+        with mock.patch(
+            'address.geocoding.fetch_coordinates',
+            return_value=('55.76', '37.62'),
+        ) as fetch:
+            restaurant.save()
+        fetch.assert_called_once()
+        restaurant.refresh_from_db()
+        self.assertEqual((restaurant.latitude, restaurant.longitude), (55.76, 37.62))
+
+
+@override_settings(CACHES=TEST_CACHES, GEOCODER_NEGATIVE_TTL=600)
+class GeocodeBackfillTests(TestCase):
+    RATE = 20
+
+    def setUp(self):
+        self.calls = []
+        self.failing = {'сбойный адрес', 'устаревший недоступный адрес'}
+        expired_at = timezone.now() - timedelta(days=365)
+        Address.objects.bulk_create([
+            Address(address='новый адрес'),
+            Address(address='сбойный адрес'),
+            Address(
+                address='устаревший адрес',
+                latitude=1,
+                longitude=1,
+                request_date=expired_at,
+            ),
+            Address(
+                address='устаревший недоступный адрес',
+                latitude=1,
+                longitude=1,
+                request_date=expired_at,
+            ),
+            Address(address='свежий адрес', latitude=1, longitude=1),
+        ])
+
+    def fetch_coordinates(self, apikey, address):
+        self.calls.append((time.monotonic(), address))
+        if address in self.failing:
+            raise requests.exceptions.ConnectionError
+        return '55.75', '37.61'
+
+    def backfill(self):
+        self.calls = []
+        with mock.patch(
+            'address.geocoding.fetch_coordinates',
+            side_effect=self.fetch_coordinates,
+        ):
+            call_command(
+                'geocode_backfill',
+                rate=self.RATE,
+                workers=4,
+                skip_restaurants=True,
+                stdout=io.StringIO(),
+            )
+        return sorted(address for called_at, address in self.calls)
+
+    def coordinates(self, address):
+        return Address.objects.get(address=address).coordinates()
+
+    def test_backfill_refreshes_stale_and_retries_failures_later(self):
+        self.assertEqual(self.backfill(), [
+            'новый адрес',
+            'сбойный адрес',
+            'устаревший адрес',
+            'устаревший недоступный адрес',
+        ])
+        started_at = [called_at for called_at, address in sorted(self.calls)]
+        for previous, current in zip(started_at, started_at[1:]):
+            self.assertGreaterEqual(current - previous, 1 / self.RATE - 0.005)
+
+        self.assertEqual(self.coordinates('новый адрес'), (55.75, 37.61))
+        self.assertEqual(self.coordinates('устаревший адрес'), (55.75, 37.61))
+        self.assertEqual(self.coordinates('устаревший недоступный адрес'), (1, 1))
+        self.assertIsNone(self.coordinates('сбойный адрес'))
+
+        # Неудачные адреса не спрашиваем снова до конца GEOCODER_NEGATIVE_TTL
+        self.assertEqual(self.backfill(), [])
+
+        self.failing = set()
+        Address.objects.filter(attempts__gt=0).update(
+            request_date=timezone.now() - timedelta(seconds=601),
+        )
+        self.assertEqual(self.backfill(), ['сбойный адрес'])
+        self.assertEqual(self.coordinates('сбойный адрес'), (55.75, 37.61))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OrderTotalTests(TestCase):
+    def setUp(self):
+        self.burger, self.fries = [
+            Product.objects.create(name=name, price=price, image='burger.jpg')
+            for name, price in [('Бургер', 300), ('Картошка', 120)]
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order = Order.objects.create(
+                address='Москва, Тверская, 1',
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79001234567',
+                payment='cash',
+            )
+
+    def add_element(self, product, quantity):
+        return OrderElement.objects.create(
+            order=self.order,
+            product=product,
+            quantity=quantity,
+            price=product.price,
+        )
+
+    def assert_total(self, total):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, total)
+
+    def test_total_follows_elements(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            burger = self.add_element(self.burger, 2)
+            fries = self.add_element(self.fries, 1)
+        self.assertEqual(len(callbacks), 1)
+        self.assert_total(720)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            burger.quantity = 3
+            burger.save()
+        self.assert_total(1020)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fries.delete()
+        self.assert_total(900)
+
+    def test_cascade_delete_recounts_order_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for quantity in range(1, 21):
+                self.add_element(self.burger, quantity)
+        self.assert_total(300 * sum(range(1, 21)))
+
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.order.delete()
+        total_updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "foodcartapp_order"')
+        ]
+        self.assertEqual(len(total_updates), 1)
+        self.assertFalse(OrderElement.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MenuImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.burger = Product.objects.create(
+            name='Бургер',
+            price=300,
+            image='burger.jpg',
+        )
+
+    def import_csv(self, content):
+        rows = read_menu_rows(io.StringIO(content), 'csv')
+        menu_import = None
+        for menu_import in import_menu(rows):
+            pass
+        return menu_import
+
+    def test_new_product_without_image_is_rejected(self):
+        menu_import = self.import_csv(
+            'restaurant,product,price\n'
+            'Ресторан,Картошка,120\n'
+        )
+        self.assertEqual(
+            menu_import.errors,
+            [(1, 'Для нового товара Картошка не указана картинка')],
+        )
+        self.assertFalse(Product.objects.filter(name='Картошка').exists())
+        self.assertFalse(RestaurantMenuItem.objects.exists())
+
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_image_may_come_from_any_row_of_new_product(self):
+        menu_import = self.import_csv(
+            'restaurant,product,price,image\n'
+            'Первый,Картошка,120,\n'
+            'Второй,Картошка,120,fries.jpg\n'
+        )
+        self.assertEqual(menu_import.errors, [])
+        self.assertEqual(Product.objects.get(name='Картошка').image, 'fries.jpg')
+        self.assertEqual(RestaurantMenuItem.objects.count(), 2)
+
+    def test_export_command_writes_to_its_stdout(self):
+        self.import_csv(
+            'restaurant,product,price\n'
+            'Первый,Бургер,300\n'
+            'Второй,Бургер,320\n'
+        )
+        for file_format in ['csv', 'jsonl']:
+            with self.subTest(file_format=file_format):
+                stdout = io.StringIO()
+                call_command('export_menu', '--format', file_format, stdout=stdout)
+                content = stdout.getvalue()
+                self.assertNotIn('\n\n', content)
+                rows = list(read_menu_rows(io.StringIO(content), file_format))
+                self.assertEqual(
+                    sorted((row['restaurant'], row['product']) for row in rows),
+                    [('Второй', 'Бургер'), ('Первый', 'Бургер')],
+                )
+
+    def test_existing_product_keeps_image(self):
+        menu_import = self.import_csv(
+            'restaurant,product,price\n'
+            'Ресторан,Бургер,350\n'
+        )
+        self.assertEqual(menu_import.errors, [])
+        self.burger.refresh_from_db()
+        self.assertEqual(self.burger.price, 350)
+        self.assertEqual(self.burger.image, 'burger.jpg')
+        self.assertEqual(RestaurantMenuItem.objects.get().product, self.burger)
+
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [product['name'] for product in response.json()],
+            ['Бургер'],
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BenchmarkCommandTests(TestCase):
+    def run_benchmark(self, *args):
+        stdout = io.StringIO()
+        call_command('benchmark', *args, stdout=stdout)
+        return stdout.getvalue().splitlines()
+
+    def test_distances(self):
+        lines = self.run_benchmark(
+            'distances', '--restaurants', '3', '--orders', '2', '5',
+        )
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('5 заказов × 3 ресторанов'))
+
+    def test_catalog_rolls_back_seeded_data(self):
+        lines = self.run_benchmark(
+            'catalog', '--restaurants', '2', '--products', '30',
+        )
+        self.assertEqual(len(lines), 5)
+        self.assertIn('1 запросов', lines[-1])
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(Restaurant.objects.exists())
+
+    def test_orders(self):
+        lines = self.run_benchmark(
+            'orders', '--products', '20', '--carts', '1', '5', '--repeat', '2',
+        )
+        self.assertEqual(len(lines), 2)
+        for line in lines:
+            self.assertIn(f'{ORDER_QUERIES} запросов', line)
+        self.assertFalse(Order.objects.exists())
+
+    def test_availability(self):
+        lines = self.run_benchmark(
+            'availability', '--restaurants', '3', '--products', '30',
+        )
+        self.assertEqual(len(lines), 4)
+        self.assertIn('2 запросов', lines[2])
+        self.assertFalse(RestaurantMenuItem.objects.exists())
+
+
+class SalesRollupMixin:
+    def setUp(self):
+        self.restaurants = [
+            Restaurant.objects.create(name=name)
+            for name in ['Первый', 'Второй']
+        ]
+        self.product = Product.objects.create(
+            name='Бургер',
+            price=300,
+            image='burger.jpg',
+        )
+        self.registered_at = timezone.now() - timedelta(days=1)
+
+    def create_order(self, restaurant, quantity=1, payment='cash'):
+        order = Order.objects.create(
+            address='Москва, Тверская, 1',
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            payment=payment,
+            restaurant=restaurant,
+            registered_at=self.registered_at,
+        )
+        OrderElement.objects.create(
+            order=order,
+            product=self.product,
+            quantity=quantity,
+            price=self.product.price,
+        )
+        return order
+
+    def sales(self, granularity):
+        return dict(
+            SalesRollup.objects.filter(granularity=granularity)
+            .values_list('restaurant')
+            .annotate(revenue=Sum('revenue'))
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SalesRollupTests(SalesRollupMixin, TestCase):
+    def test_deleted_restaurant_keeps_its_sales(self):
+        first, second = self.restaurants
+        self.create_order(first, quantity=2)
+        self.create_order(second)
+        self.create_order(None)
+        update_sales_rollups()
+        self.assertEqual(self.sales('day'), {
+            first.id: 600,
+            second.id: 300,
+            None: 300,
+        })
+
+        first.delete()
+
+        self.assertEqual(Order.objects.count(), 3)
+        for granularity in ['hour', 'day', 'month']:
+            with self.subTest(granularity=granularity):
+                self.assertEqual(
+                    self.sales(granularity),
+                    {second.id: 300, None: 900},
+                )
+
+    def test_duplicate_rollups_are_rejected(self):
+        for restaurant in [self.restaurants[0], None]:
+            with self.subTest(restaurant=restaurant):
+                fields = {
+                    'granularity': 'hour',
+                    'period_start': truncate_hour(self.registered_at),
+                    'restaurant': restaurant,
+                    'product': self.product,
+                    'payment': 'cash',
+                    'orders_count': 1,
+                    'quantity': 1,
+                    'revenue': 300,
+                }
+                SalesRollup.objects.create(**fields)
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    SalesRollup.objects.create(**fields)
+
+    def test_bulk_delete_refreshes_each_hour_once(self):
+        hours = [
+            self.registered_at - timedelta(hours=shift) for shift in range(3)
+        ]
+        for registered_at in hours * 2:
+            self.registered_at = registered_at
+            self.create_order(self.restaurants[0])
+        self.create_order(self.restaurants[1])
+        update_sales_rollups()
+
+        with mock.patch(
+            'foodcartapp.rollups.refresh_hour_periods',
+            wraps=refresh_hour_periods,
+        ) as refresh, self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Order.objects.filter(restaurant=self.restaurants[0]).delete()
+
+        self.assertEqual(len(callbacks), 1)
+        refresh.assert_called_once_with({truncate_hour(hour) for hour in hours})
+        self.assertEqual(self.sales('day'), {self.restaurants[1].id: 300})
+
+    def test_rolled_back_delete_does_not_swallow_next_refresh(self):
+        rolled_back = self.create_order(self.restaurants[0])
+        rolled_back_pk = rolled_back.pk
+        self.registered_at -= timedelta(hours=1)
+        deleted = self.create_order(self.restaurants[0])
+        update_sales_rollups()
+
+        with mock.patch(
+            'foodcartapp.rollups.refresh_hour_periods',
+            wraps=refresh_hour_periods,
+        ) as refresh, self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                rolled_back.delete()
+                raise RuntimeError
+            deleted.delete()
+
+        self.assertEqual(len(callbacks), 1)
+        refresh.assert_called_once_with({truncate_hour(self.registered_at)})
+        self.assertTrue(Order.objects.filter(pk=rolled_back_pk).exists())
+        self.assertEqual(self.sales('hour'), {self.restaurants[0].id: 300})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ConcurrentSalesRollupTests(SalesRollupMixin, TransactionTestCase):
+    THREADS = 4
+
+    def refresh_in_thread(self, barrier, errors):
+        try:
+            barrier.wait()
+            refresh_periods([self.registered_at])
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def test_parallel_refreshes_do_not_double_revenue(self):
+        self.create_order(self.restaurants[0], quantity=2)
+        self.create_order(None)
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+        threads = [
+            threading.Thread(
+                target=self.refresh_in_thread,
+                args=(barrier, errors),
+            )
+            for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for granularity in ['hour', 'day', 'month']:
+            with self.subTest(granularity=granularity):
+                self.assertEqual(
+                    self.sales(granularity),
+                    {self.restaurants[0].id: 600, None: 300},
+                )
@@ -0,0 +1,97 @@
+import json
+import threading
+import weakref
+from itertools import islice
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class InvalidLine:
+    def __init__(self, error):
+        self.error = error
+
+
+def read_ndjson(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            yield InvalidLine(str(error))
+
+
+def iterate_chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class VersionedCache:
+    # Большие индексы лежат в общем кэше, а процесс держит свою копию
+    # и перечитывает её, только когда в кэше сменилась короткая версия
+    def __init__(self, key, build):
+        self.key = key
+        self.version_key = f'{key}:version'
+        self.build = build
+        self.memo = (None, None)
+
+    def get(self):
+        timeout = settings.MENU_CACHE_TIMEOUT
+        version = cache.get(self.version_key)
+        if version is None:
+            # Версия истекла или кэш очищен: новая версия не совпадёт
+            # ни с одной копией в процессах, и индекс перестроится
+            cache.add(self.version_key, uuid4().hex, timeout)
+            version = cache.get(self.version_key)
+        memo_version, value = self.memo
+        if version is not None and version == memo_version:
+            return value
+
+        value = cache.get(f'{self.key}:{version}')
+        if value is None:
+            value = self.build()
+            cache.set(f'{self.key}:{version}', value, timeout)
+        self.memo = (version, value)
+        return value
+
+    def invalidate(self):
+        cache.set(self.version_key, uuid4().hex, settings.MENU_CACHE_TIMEOUT)
+
+
+class PendingBatch:
+    def __init__(self, handle):
+        self.handle = handle
+        self.values = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        self.handle(self.values)
+
+
+class OnCommitBatch:
+    # Копит значения за транзакцию и обрабатывает их разом после коммита.
+    # Обработчик держим по слабой ссылке: после коммита или отката Django
+    # его отпускает, и следующая транзакция заводит новый
+    def __init__(self, handle):
+        self.handle = handle
+        self.local = threading.local()
+
+    def add(self, values):
+        if not transaction.get_connection().in_atomic_block:
+            self.handle(set(values))
+            return
+        pending = getattr(self.local, 'pending', lambda: None)()
+        if pending is None or pending.done:
+            pending = PendingBatch(self.handle)
+            transaction.on_commit(pending)
+            self.local.pending = weakref.ref(pending)
+        pending.values.update(values)
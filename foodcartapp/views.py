@@ -1,12 +1,26 @@
-from django.db import transaction
-from django.http import JsonResponse
+import hashlib
+import json
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
 from django.templatetags.static import static
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from .models import Product
+from .catalog import CATALOG_MAX_PAGE_SIZE, filter_catalog, get_catalog
+from .intake import register_orders
+from .models import IdempotencyKey
 from .serializers import OrderSerializer
+from .utils import read_ndjson
+
+IDEMPOTENCY_KEY_MAX_LENGTH = IdempotencyKey._meta.get_field('key').max_length
 
 
 def banners_list_api(request):
@@ -33,38 +47,150 @@ def banners_list_api(request):
     })
 
 
-def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
-        }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
+CATALOG_FILTERS = {
+    'category': int,
+    'special_status': lambda value: {'true': True, 'false': False}[value],
+    'restaurant': int,
+    'cursor': int,
+    'limit': lambda value: min(max(int(value), 1), CATALOG_MAX_PAGE_SIZE),
+}
+
+
+def filtered_product_list_api(request):
+    filters = {}
+    for name, parse in CATALOG_FILTERS.items():
+        if name not in request.GET:
+            continue
+        try:
+            filters[name] = parse(request.GET[name])
+        except (KeyError, ValueError):
+            return JsonResponse(
+                {'error': f'Некорректное значение параметра {name}'},
+                status=400,
+                json_dumps_params={'ensure_ascii': False},
+            )
+    return JsonResponse(filter_catalog(**filters), json_dumps_params={
         'ensure_ascii': False,
-        'indent': 4,
     })
 
 
+def product_list_api(request):
+    if request.GET.keys() & CATALOG_FILTERS.keys():
+        return filtered_product_list_api(request)
+    return cached_product_list_api(request)
+
+
+def get_request_catalog(request):
+    # ETag, Last-Modified и тело должны описывать один и тот же каталог,
+    # даже если его сбросят посреди запроса
+    if not hasattr(request, 'catalog'):
+        request.catalog = get_catalog()
+    return request.catalog
+
+
+@condition(
+    etag_func=lambda request: get_request_catalog(request)['etag'],
+    last_modified_func=lambda request: (
+        get_request_catalog(request)['last_modified']
+    ),
+)
+def cached_product_list_api(request):
+    response = HttpResponse(
+        get_request_catalog(request)['content'],
+        content_type='application/json',
+    )
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def fingerprint_request(data):
+    payload = json.dumps(
+        data,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(',', ':'),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def replay_order(idempotency_key, fingerprint):
+    # У ключей, созданных до появления отпечатков, сверять нечего
+    if idempotency_key.fingerprint not in ('', fingerprint):
+        return Response(
+            data={'non_field_errors': [
+                'Заголовок Idempotency-Key уже использован для другого заказа',
+            ]},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(
+        data=OrderSerializer(idempotency_key.order).data,
+        status=status.HTTP_201_CREATED,
+        headers={'Idempotent-Replayed': 'true'},
+    )
+
+
 @api_view(['POST'])
-@transaction.atomic
 def register_order(request):
+    key = request.headers.get('Idempotency-Key')
+    if key and len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return Response(
+            data={'non_field_errors': [
+                f'Заголовок Idempotency-Key длиннее '
+                f'{IDEMPOTENCY_KEY_MAX_LENGTH} символов',
+            ]},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if key:
+        fingerprint = fingerprint_request(request.data)
+        idempotency_key = IdempotencyKey.objects.active()\
+            .select_related('order').filter(key=key).first()
+        if idempotency_key:
+            return replay_order(idempotency_key, fingerprint)
+
     serializer = OrderSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
-    serializer.save()
+    if not key:
+        serializer.save()
+        return Response(data=serializer.data, status=status.HTTP_201_CREATED)
+
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.expired().filter(key=key).delete()
+            order = serializer.save()
+            IdempotencyKey.objects.create(
+                key=key,
+                order=order,
+                expires_at=timezone.now() + timedelta(
+                    seconds=settings.IDEMPOTENCY_KEY_TTL,
+                ),
+                fingerprint=fingerprint,
+            )
+    except IntegrityError:
+        # Параллельный запрос с тем же ключом успел создать заказ первым
+        idempotency_key = IdempotencyKey.objects.select_related('order')\
+            .get(key=key)
+        return replay_order(idempotency_key, fingerprint)
     return Response(data=serializer.data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+def register_orders_in_bulk(request):
+    if request.content_type.startswith('application/x-ndjson'):
+        # Тело читаем построчно, не загружая целиком в память
+        payloads = read_ndjson(iter(request.readline, b''))
+        first_payload = next(payloads, None)
+        if first_payload is None:
+            return Response(
+                data={'non_field_errors': ['Пустое тело запроса']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        payloads = chain([first_payload], payloads)
+    else:
+        payloads = request.data
+        if not isinstance(payloads, list):
+            return Response(
+                data={'non_field_errors': ['Ожидается список заказов']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+    return Response(data={'results': register_orders(payloads)})
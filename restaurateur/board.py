@@ -0,0 +1,30 @@
+import threading
+from datetime import timedelta
+
+ORDER_STREAM_HEARTBEAT = 15
+# Поток держит поток веб-сервера, поэтому время от времени закрываем его,
+# а браузер сам переподключается с последним курсором
+ORDER_STREAM_LIFETIME = 5 * 60
+ORDER_STREAM_RETRY = 1000
+ORDER_CHANGES_OVERLAP = timedelta(minutes=1)
+STATUS_COUNTS_CACHE_KEY = 'restaurateur:status_counts'
+STATUS_COUNTS_CACHE_TIMEOUT = 10
+
+
+class BoardNotifier:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+
+    def notify(self):
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(self, version, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+board_notifier = BoardNotifier()
@@ -0,0 +1,78 @@
+import csv
+import io
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from foodcartapp.models import ORDER_STATUS, OrderElement
+from foodcartapp.utils import iterate_chunks
+
+ORDERS_EXPORT_CHUNK_SIZE = 2000
+ORDERS_EXPORT_FIELDS = [
+    ('order__id', 'Заказ'),
+    ('order__registered_at', 'Дата регистрации'),
+    ('order__status', 'Статус'),
+    ('order__payment', 'Способ оплаты'),
+    ('order__restaurant__name', 'Ресторан'),
+    ('order__lastname', 'Фамилия'),
+    ('order__firstname', 'Имя'),
+    ('order__phonenumber', 'Телефон'),
+    ('order__address', 'Адрес'),
+    ('product__name', 'Товар'),
+    ('quantity', 'Количество'),
+    ('price', 'Цена'),
+]
+
+
+def parse_day(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f'Некорректная дата: {value}')
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def parse_export_filters(since=None, until=None, statuses=None):
+    filters = {}
+    if since:
+        filters['order__registered_at__gte'] = parse_day(since)
+    if until:
+        filters['order__registered_at__lt'] = parse_day(until) + timedelta(days=1)
+    if statuses:
+        unknown = set(statuses) - dict(ORDER_STATUS).keys()
+        if unknown:
+            raise ValueError(f'Неизвестные статусы: {", ".join(sorted(unknown))}')
+        filters['order__status__in'] = statuses
+    return filters
+
+
+def export_order_rows(filters, chunk_size=ORDERS_EXPORT_CHUNK_SIZE):
+    yield [title for field, title in ORDERS_EXPORT_FIELDS] + ['Сумма']
+    order_elements = OrderElement.objects.filter(**filters)\
+        .order_by('order', 'id')\
+        .values_list(*[field for field, title in ORDERS_EXPORT_FIELDS])
+    current_timezone = timezone.get_current_timezone()
+    for values in order_elements.iterator(chunk_size=chunk_size):
+        order_id, registered_at, *order_fields, quantity, price = values
+        # Сумма по цене на момент заказа, а не по текущей цене товара
+        yield [
+            order_id,
+            registered_at.astimezone(current_timezone)
+            .isoformat(timespec='seconds'),
+            *order_fields,
+            quantity,
+            price,
+            price * quantity,
+        ]
+
+
+def stream_orders_csv(filters, chunk_size=ORDERS_EXPORT_CHUNK_SIZE):
+    # Отдаём CSV кусками по chunk_size строк, а не по строке за раз
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows = export_order_rows(filters, chunk_size)
+    for rows_chunk in iterate_chunks(rows, chunk_size):
+        writer.writerows(rows_chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
@@ -0,0 +1,34 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurateur.exports import export_order_rows, parse_export_filters
+
+
+class Command(BaseCommand):
+    help = 'Выгружает позиции заказов в CSV для бухгалтерии'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Первый день периода, ГГГГ-ММ-ДД')
+        parser.add_argument('--until', help='Последний день периода, ГГГГ-ММ-ДД')
+        parser.add_argument('--status', dest='statuses', action='append')
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки, по умолчанию стандартный вывод',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_export_filters(
+                since=options['since'],
+                until=options['until'],
+                statuses=options['statuses'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        if not options['output']:
+            csv.writer(self.stdout).writerows(export_order_rows(filters))
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as stream:
+            csv.writer(stream).writerows(export_order_rows(filters))
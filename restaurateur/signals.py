@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from foodcartapp.models import Order
+from foodcartapp.signals import orders_created
+from .board import board_notifier
+
+
+@receiver(post_save, sender=Order)
+@receiver(orders_created, sender=Order)
+def notify_order_board(sender, **kwargs):
+    transaction.on_commit(board_notifier.notify)
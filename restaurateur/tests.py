@@ -1,3 +1,222 @@
-from django.test import TestCase
+import csv
+import io
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from address.models import Address
+from foodcartapp.models import Order, OrderElement, Product, Restaurant
+from foodcartapp.models import RestaurantMenuItem
+from .board import ORDER_CHANGES_OVERLAP, board_notifier
+from .views import collect_order_changes, stream_order_changes
+
+# Тесты чистят кэш, поэтому работают со своим, а не с общим кэшем сайта
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+
+def create_restaurants(coordinates):
+    restaurants = [
+        Restaurant(name=f'Ресторан {number}', latitude=lat, longitude=lon)
+        for number, (lat, lon) in enumerate(coordinates)
+    ]
+    for restaurant in restaurants:
+        restaurant.update_geohash()
+    # bulk_create не отправляет сигналы, поэтому геокодер не вызывается
+    Restaurant.objects.bulk_create(restaurants)
+    return list(Restaurant.objects.order_by('id'))
+
+
+def create_orders(count, products, status='01_created'):
+    orders = []
+    for number in range(count):
+        order = Order.objects.create(
+            address=f'Москва, Тверская, {number}',
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            payment='cash',
+            status=status,
+        )
+        for product in products:
+            OrderElement.objects.create(
+                order=order,
+                product=product,
+                quantity=2,
+                price=product.price,
+            )
+        orders.append(order)
+    Address.objects.filter(address__startswith='москва').update(
+        latitude=55.75,
+        longitude=37.61,
+    )
+    return orders
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ManagerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        manager = User.objects.create_user('manager', is_staff=True)
+        self.client.force_login(manager)
+
+        self.restaurants = create_restaurants([
+            (55.76, 37.62),
+            (55.70, 37.50),
+            (55.80, 37.70),
+        ])
+        self.products = [
+            Product.objects.create(name=name, price=price, image='burger.jpg')
+            for name, price in [('Бургер', 300), ('Картошка', 120)]
+        ]
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=restaurant, product=product)
+            for restaurant in self.restaurants
+            for product in self.products
+        ])
+        cache.clear()
+
+
+class OrderBoardTests(ManagerTestCase):
+    # Сессия, пользователь, заказы, их позиции и координаты адресов —
+    # независимо от числа заказов на странице
+    BOARD_QUERIES = 5
+
+    def assert_board_queries(self, orders_count):
+        Order.objects.all().delete()
+        create_orders(orders_count, self.products)
+        # Индексы меню и ресторанов и счётчики вкладок строятся
+        # при первом запросе и берутся из кэша
+        self.client.get(reverse('restaurateur:view_orders'))
+        with self.assertNumQueries(self.BOARD_QUERIES):
+            response = self.client.get(reverse('restaurateur:view_orders'))
+        self.assertEqual(len(response.context['orders']), orders_count)
+        for order in response.context['orders']:
+            self.assertEqual(len(order.available_in), len(self.restaurants))
+            self.assertNotIn('расстояние неизвестно', order.available_in[0])
+
+    def test_board_query_count_does_not_grow_with_orders(self):
+        self.assert_board_queries(5)
+        self.assert_board_queries(15)
+
+
+class OrderChangesTests(ManagerTestCase):
+    def test_late_commit_behind_cursor_is_delivered_once(self):
+        first_order, late_order = create_orders(2, self.products)
+        cursor = timezone.now()
+        # Транзакция поставила updated_at раньше курсора, а закоммитилась позже
+        Order.objects.filter(pk=late_order.pk).update(
+            updated_at=cursor - timedelta(seconds=10),
+        )
+        Order.objects.filter(pk=first_order.pk).update(
+            updated_at=cursor - ORDER_CHANGES_OVERLAP - timedelta(seconds=1),
+        )
+
+        next_cursor, changes, sent_versions = collect_order_changes(cursor)
+        self.assertEqual(next_cursor, cursor)
+        self.assertEqual([change['id'] for change in changes], [late_order.pk])
+        self.assertIsNotNone(changes[0]['html'])
+
+        next_cursor, changes, sent_versions = collect_order_changes(
+            next_cursor,
+            sent_versions,
+        )
+        self.assertEqual(changes, [])
+
+        late_order.refresh_from_db()
+        late_order.status = '02_cooking'
+        late_order.save()
+        next_cursor, changes, sent_versions = collect_order_changes(
+            next_cursor,
+            sent_versions,
+        )
+        self.assertEqual(
+            [(change['id'], change['status']) for change in changes],
+            [(late_order.pk, '02_cooking')],
+        )
+        self.assertGreater(next_cursor, cursor)
+
+
+    def test_stream_releases_connection_and_expires(self):
+        order = create_orders(1, self.products)[0]
+        cursor = timezone.now() - timedelta(seconds=5)
+        with mock.patch('restaurateur.views.connection') as db, \
+                mock.patch('restaurateur.views.ORDER_STREAM_LIFETIME', 0), \
+                mock.patch.object(board_notifier, 'wait', return_value=0):
+            events = list(stream_order_changes(cursor))
+
+        self.assertEqual(len(events), 2)
+        self.assertIn(f'"id": {order.pk}', events[0])
+        self.assertTrue(events[1].startswith('retry: '))
+        self.assertIn('"orders": []', events[1])
+        self.assertEqual(db.close.call_count, 2)
+
+
+class OrdersExportTests(ManagerTestCase):
+    def export(self, **params):
+        response = self.client.get(reverse('restaurateur:orders_export'), params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        return list(csv.reader(content.splitlines()))
+
+    def test_export_filters_orders_and_uses_order_prices(self):
+        orders = create_orders(2, self.products)
+        old_order, = create_orders(1, self.products)
+        Order.objects.filter(pk=old_order.pk).update(
+            registered_at=timezone.now() - timedelta(days=10),
+        )
+        completed_order, = create_orders(
+            1, self.products, status='04_completed',
+        )
+        # Сумма считается по цене на момент заказа
+        Product.objects.update(price=999)
+
+        header, *rows = self.export(
+            since=timezone.localdate().isoformat(),
+            status='01_created',
+        )
+        self.assertEqual(header[0], 'Заказ')
+        self.assertEqual(header[-1], 'Сумма')
+        self.assertEqual(
+            [(int(row[0]), row[9], row[-3], row[-2], row[-1]) for row in rows],
+            [
+                (order.id, name, '2', price, total)
+                for order in orders
+                for name, price, total in [
+                    ('Бургер', '300.00', '600.00'),
+                    ('Картошка', '120.00', '240.00'),
+                ]
+            ],
+        )
+
+        order_ids = {int(row[0]) for row in self.export()[1:]}
+        self.assertEqual(
+            order_ids,
+            {order.id for order in [*orders, old_order, completed_order]},
+        )
+
+    def test_export_command_writes_to_its_stdout(self):
+        order, = create_orders(1, self.products)
+        stdout = io.StringIO()
+        call_command('export_orders', '--status', '01_created', stdout=stdout)
+        header, *rows = csv.reader(stdout.getvalue().splitlines())
+        self.assertEqual(header[-1], 'Сумма')
+        self.assertEqual([int(row[0]) for row in rows], [order.id, order.id])
+
+    def test_invalid_filters_are_rejected(self):
+        for params in [{'since': 'вчера'}, {'status': 'unknown'}]:
+            with self.subTest(params=params):
+                response = self.client.get(
+                    reverse('restaurateur:orders_export'),
+                    params,
+                )
+                self.assertEqual(response.status_code, 400)
@@ -9,11 +9,21 @@ urlpatterns = [
     path('', lambda request: redirect('restaurateur:ProductsView')),
 
     path('products/', views.view_products, name="ProductsView"),
+    path(
+        'products/availability/',
+        views.update_menu_availability,
+        name="menu_availability",
+    ),
 
     path('restaurants/', views.view_restaurants, name="RestaurantView"),
 
     # TODO заглушка для нереализованного функционала
     path('orders/', views.view_orders, name="view_orders"),
+    path('orders/export.csv', views.export_orders_csv, name="orders_export"),
+    path('orders/changes/', views.view_order_changes, name="order_changes"),
+    path('orders/stream/', views.view_order_stream, name="order_stream"),
+
+    path('reports/sales/', views.view_sales_report, name="sales_report"),
 
     path('login/', views.LoginView.as_view(), name="login"),
     path('logout/', views.LogoutView.as_view(), name="logout"),
@@ -1,14 +1,48 @@
+import json
+import math
+import time
+from datetime import timedelta
+
 from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views import View
+from django.views.decorators.http import require_POST
 from django.urls import reverse_lazy
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
-from geopy import distance
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Count, Q, Sum
+
+from foodcartapp.models import ORDER_STATUS, Product, ProductCategory
+from foodcartapp.models import PAYMENT_METHOD, Restaurant, Order, SalesRollup
+from foodcartapp.availability import get_availability_matrix
+from foodcartapp.availability import select_menu_items, set_availability
+from foodcartapp.menu import get_menu_index
+from foodcartapp.spatial import get_restaurant_index
+from foodcartapp.geocoding import get_orders_coordinates
+from foodcartapp.rollups import select_rollups
+from .board import ORDER_CHANGES_OVERLAP, ORDER_STREAM_HEARTBEAT
+from .board import ORDER_STREAM_LIFETIME, ORDER_STREAM_RETRY
+from .board import STATUS_COUNTS_CACHE_KEY, STATUS_COUNTS_CACHE_TIMEOUT
+from .board import board_notifier
+from .exports import parse_day, parse_export_filters, stream_orders_csv
 
-from foodcartapp.models import Product, Restaurant, Order, RestaurantMenuItem
-from address.models import Address
+ORDERS_PAGE_SIZE = 50
+PRODUCTS_PAGE_SIZE = 100
+SALES_REPORT_GROUPS = {
+    'restaurant': ('restaurant__name', 'Ресторан'),
+    'product': ('product__name', 'Товар'),
+    'payment': ('payment', 'Способ оплаты'),
+    'period': ('period_start', 'День'),
+}
 
 
 class Login(forms.Form):
@@ -65,24 +99,72 @@ def is_manager(user):
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_products(request):
-    restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
+    matrix = get_availability_matrix()
+    categories = list(ProductCategory.objects.order_by('name'))
+    try:
+        category_id = int(request.GET['category'])
+    except (KeyError, ValueError):
+        category_id = None
 
-    products_with_restaurant_availability = []
-    for product in products:
-        availability = {item.restaurant_id: item.availability for item in product.menu_items.all()}
-        ordered_availability = [availability.get(restaurant.id, False) for restaurant in restaurants]
+    paginator = Paginator(matrix.filter(category_id), PRODUCTS_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('page'))
+    positions = list(page.object_list)
+    products = Product.objects.select_related('category')\
+        .in_bulk(matrix.product_ids[positions].tolist())
 
-        products_with_restaurant_availability.append(
-            (product, ordered_availability)
+    products_with_restaurant_availability = [
+        (products[product_id], availability)
+        for product_id, availability in zip(
+            matrix.product_ids[positions].tolist(),
+            matrix.rows(positions).tolist(),
         )
+        if product_id in products
+    ]
 
     return render(request, template_name="products_list.html", context={
         'products_with_restaurant_availability': products_with_restaurant_availability,
-        'restaurants': restaurants,
+        'restaurants': matrix.restaurant_names,
+        'categories': categories,
+        'category_id': category_id,
+        'page': page,
     })
 
 
+def parse_ids(values):
+    if values is None:
+        return None
+    return [int(value) for value in values]
+
+
+@require_POST
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def update_menu_availability(request):
+    try:
+        data = json.loads(request.body)
+        availability = data['availability']
+        if not isinstance(availability, bool):
+            raise ValueError('availability должно быть true или false')
+        pairs = data.get('pairs')
+        if pairs is not None:
+            pairs = [
+                (int(restaurant_id), int(product_id))
+                for restaurant_id, product_id in pairs
+            ]
+        category = data.get('category')
+        menu_items = select_menu_items(
+            pairs=pairs,
+            category=None if category is None else int(category),
+            restaurants=parse_ids(data.get('restaurants')),
+        )
+    except KeyError as error:
+        return JsonResponse({'error': f'Не указано поле {error}'}, status=400)
+    except (ValueError, TypeError) as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    updated = set_availability(menu_items, availability)
+    return JsonResponse({'updated': updated})
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_restaurants(request):
     return render(request, template_name="restaurants_list.html", context={
@@ -90,49 +172,287 @@ def view_restaurants(request):
     })
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_orders(request):
-    items = RestaurantMenuItem.objects.all()
-    products_vs_rests = items.values('product', 'restaurant__name')
-    restaurants = list(Restaurant.objects.all())
-
-    orders = Order.objects.with_price().exclude(status='04_completed')\
-        .order_by('status')
-    addresses = []
-    for order in orders:
-        addresses.append(order.address)
-    orders_addresses = Address.objects.filter(address__in=addresses)
-
-    for order in orders:
-        for element in order.elements.all():
-            available_in = list(filter(
-                lambda d: d['product'] == element.product.id, products_vs_rests
-            ))
-            element.available_in = [d['restaurant__name'] for d in available_in]
-
-        order_available_in = set.intersection(
-            *map(set, [elem.available_in for elem in order.elements.all()])
-        )
+def format_distance(restaurant_name, km):
+    if math.isnan(km):
+        return f'{restaurant_name} - расстояние неизвестно'
+    return f'{restaurant_name} - {km:.2f} км'
 
-        order_address = orders_addresses.get(address=order.address)
-        order_coord = (order_address.latitude, order_address.longitude)
+
+def prepare_orders(orders):
+    menu_index = get_menu_index()
+    restaurant_index = get_restaurant_index()
+    orders_coords = get_orders_coordinates(orders)
+
+    for order, (lat, lon) in zip(orders, orders_coords):
+        order_available_in = menu_index.restaurants_for(
+            element.product_id for element in order.elements.all()
+        )
 
         restaurants_with_distances = []
-        for restaurant in restaurants:
-            if restaurant.name in order_available_in:
-                restaurant_coord = (restaurant.latitude, restaurant.longitude)
-                restaurants_with_distances.append(
-                    (restaurant.name, distance.distance(
-                        order_coord,
-                        restaurant_coord,
-                    ).km),
-                )
-
-        restaurants_with_distances.sort(key=lambda dist: dist[1])
-        text = '{} - {:.2f} км'
+        if lat is not None and lon is not None:
+            restaurants_with_distances = restaurant_index.nearest(
+                lat,
+                lon,
+                k=len(order_available_in),
+                restricted_to=order_available_in,
+                geodesic=settings.GEODESIC_DISTANCES,
+            )
+        located = {restaurant_id for restaurant_id, km in restaurants_with_distances}
+        restaurants_with_distances.extend(
+            (restaurant_id, math.nan)
+            for restaurant_id in sorted(
+                order_available_in - located,
+                key=lambda restaurant_id: restaurant_index.names.get(restaurant_id, ''),
+            )
+        )
         order.available_in = [
-            text.format(rest[0], rest[1]) for rest in restaurants_with_distances
+            format_distance(restaurant_index.names.get(restaurant_id, ''), km)
+            for restaurant_id, km in restaurants_with_distances
         ]
+    return orders
+
+
+def collect_order_changes(since, sent_versions=None):
+    # auto_now ставит updated_at до коммита: транзакция, начатая раньше,
+    # может закоммититься, когда курсор уже ушёл вперёд. Поэтому перечитываем
+    # изменения с запасом и пропускаем версии, которые уже отправили
+    versions = dict(
+        Order.objects.filter(updated_at__gt=since - ORDER_CHANGES_OVERLAP)
+        .values_list('id', 'updated_at')
+    )
+    sent_versions = sent_versions or {}
+    changed_ids = [
+        order_id for order_id, updated_at in versions.items()
+        if sent_versions.get(order_id) != updated_at
+    ]
+    cursor = max([since, *versions.values()])
+    if not changed_ids:
+        return cursor, [], versions
+
+    orders = list(
+        Order.objects.filter(id__in=changed_ids)
+        .prefetch_related('elements').select_related('restaurant')
+        .order_by('updated_at')
+    )
+    prepare_orders([
+        order for order in orders if order.status != '04_completed'
+    ])
+    changes = [
+        {
+            'id': order.id,
+            'status': order.status,
+            'updated_at': order.updated_at.isoformat(),
+            'html': None if order.status == '04_completed' else render_to_string(
+                'order_row.html',
+                context={'order': order},
+            ),
+        }
+        for order in orders
+    ]
+    return cursor, changes, versions
+
+
+def parse_cursor(value):
+    cursor = parse_datetime(value or '')
+    if cursor is None:
+        raise ValueError(f'Некорректный курсор: {value}')
+    return cursor
+
+
+def parse_page_cursor(value):
+    registered_at, _, order_id = value.rpartition(',')
+    return parse_cursor(registered_at), int(order_id)
+
+
+def get_status_counts():
+    # Счётчики на вкладках читают все открытые заказы: на каждую страницу
+    # их не пересчитываем, небольшое отставание менеджеру не мешает
+    status_counts = cache.get(STATUS_COUNTS_CACHE_KEY)
+    if status_counts is None:
+        status_counts = dict(
+            Order.objects.exclude(status='04_completed')
+            .values_list('status').annotate(count=Count('id'))
+        )
+        cache.set(
+            STATUS_COUNTS_CACHE_KEY,
+            status_counts,
+            STATUS_COUNTS_CACHE_TIMEOUT,
+        )
+    return status_counts
 
-    context = {'orders': orders}
-    return render(request, template_name='order_items.html', context=context)
\ No newline at end of file
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_orders(request):
+    cursor = timezone.now()
+    board_statuses = [
+        (status, title) for status, title in ORDER_STATUS
+        if status != '04_completed'
+    ]
+    status = request.GET.get('status', board_statuses[0][0])
+    if status not in dict(board_statuses):
+        return redirect('restaurateur:view_orders')
+
+    orders = Order.objects.filter(status=status)\
+        .order_by('registered_at', 'id')
+    if request.GET.get('after'):
+        try:
+            registered_at, order_id = parse_page_cursor(request.GET['after'])
+        except ValueError:
+            return redirect('restaurateur:view_orders')
+        orders = orders.filter(
+            Q(registered_at__gt=registered_at)
+            | Q(registered_at=registered_at, id__gt=order_id)
+        )
+    orders = list(
+        orders.prefetch_related('elements').select_related('restaurant')
+        [:ORDERS_PAGE_SIZE + 1]
+    )
+    next_page = None
+    if len(orders) > ORDERS_PAGE_SIZE:
+        orders = orders[:ORDERS_PAGE_SIZE]
+        last_order = orders[-1]
+        next_page = f'{last_order.registered_at.isoformat()},{last_order.id}'
+    prepare_orders(orders)
+
+    status_counts = get_status_counts()
+    tabs = [
+        (tab_status, title, status_counts.get(tab_status, 0))
+        for tab_status, title in board_statuses
+    ]
+
+    context = {
+        'orders': orders,
+        'cursor': cursor.isoformat(),
+        'status': status,
+        'tabs': tabs,
+        'next_page': next_page,
+    }
+    return render(request, template_name='order_items.html', context=context)
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def export_orders_csv(request):
+    try:
+        filters = parse_export_filters(
+            since=request.GET.get('since'),
+            until=request.GET.get('until'),
+            statuses=request.GET.getlist('status'),
+        )
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    response = StreamingHttpResponse(
+        stream_orders_csv(filters),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = 'attachment; filename="orders.csv"'
+    return response
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_sales_report(request):
+    today = timezone.localdate()
+    since = request.GET.get('since') or (today - timedelta(days=30)).isoformat()
+    until = request.GET.get('until') or today.isoformat()
+    group = request.GET.get('group')
+    if group not in SALES_REPORT_GROUPS:
+        group = 'restaurant'
+    try:
+        period_start = parse_day(since)
+        period_end = parse_day(until) + timedelta(days=1)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    if group == 'period':
+        rollups = SalesRollup.objects.filter(
+            granularity='day',
+            period_start__gte=period_start,
+            period_start__lt=period_end,
+        )
+    else:
+        rollups = select_rollups(period_start, period_end)
+    group_field, group_title = SALES_REPORT_GROUPS[group]
+    rows = rollups.values(group_field)\
+        .annotate(
+            orders_count=Sum('orders_count'),
+            quantity=Sum('quantity'),
+            revenue=Sum('revenue'),
+        )\
+        .order_by('-revenue' if group != 'period' else group_field)
+    totals = rollups.aggregate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+    payments = dict(PAYMENT_METHOD)
+
+    context = {
+        'since': since,
+        'until': until,
+        'group': group,
+        'groups': [
+            (name, title) for name, (field, title) in SALES_REPORT_GROUPS.items()
+        ],
+        'group_title': group_title,
+        'rows': [
+            (
+                payments.get(row[group_field], row[group_field])
+                if group == 'payment' else row[group_field],
+                row['orders_count'],
+                row['quantity'],
+                row['revenue'],
+            )
+            for row in rows
+        ],
+        'totals': totals,
+    }
+    return render(request, template_name='sales_report.html', context=context)
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_order_changes(request):
+    try:
+        since = parse_cursor(request.GET.get('since'))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    cursor, changes, versions = collect_order_changes(since)
+    return JsonResponse({'cursor': cursor.isoformat(), 'orders': changes})
+
+
+def stream_order_changes(since):
+    cursor = since
+    sent_versions = {}
+    version = board_notifier.version
+    closes_at = time.monotonic() + ORDER_STREAM_LIFETIME
+    while True:
+        cursor, changes, sent_versions = collect_order_changes(
+            cursor,
+            sent_versions,
+        )
+        # Пока ждём изменений, соединение с базой не держим
+        connection.close()
+        if changes:
+            data = json.dumps({'cursor': cursor.isoformat(), 'orders': changes})
+            yield f'id: {cursor.isoformat()}\ndata: {data}\n\n'
+        elif time.monotonic() >= closes_at:
+            data = json.dumps({'cursor': cursor.isoformat(), 'orders': []})
+            yield (
+                f'retry: {ORDER_STREAM_RETRY}\n'
+                f'id: {cursor.isoformat()}\ndata: {data}\n\n'
+            )
+            return
+        else:
+            yield ': ping\n\n'
+        version = board_notifier.wait(version, ORDER_STREAM_HEARTBEAT)
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_order_stream(request):
+    # При переподключении браузер присылает id последнего события
+    since = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    try:
+        since = parse_cursor(since)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    response = StreamingHttpResponse(
+        stream_order_changes(since),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
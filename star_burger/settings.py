@@ -84,12 +84,47 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
 YANDEX_GEO_APIKEY = env('YANDEX_GEO_APIKEY')
+GEOCODER_WORKERS = env.int('GEOCODER_WORKERS', 4)
+GEOCODER_MAX_ATTEMPTS = env.int('GEOCODER_MAX_ATTEMPTS', 5)
+GEOCODER_NEGATIVE_TTL = env.int('GEOCODER_NEGATIVE_TTL', 600)
+GEOCODER_CACHE_TTL = env.int('GEOCODER_CACHE_TTL', 30 * 24 * 60 * 60)
+GEOCODER_CACHE_SIZE = env.int('GEOCODER_CACHE_SIZE', 10000)
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 3.05)
+GEOCODER_READ_TIMEOUT = env.float('GEOCODER_READ_TIMEOUT', 10)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 2)
+GEOCODER_RETRY_BACKOFF = env.float('GEOCODER_RETRY_BACKOFF', 0.5)
+GEOCODER_BREAKER_THRESHOLD = env.int('GEOCODER_BREAKER_THRESHOLD', 5)
+GEOCODER_BREAKER_TIMEOUT = env.int('GEOCODER_BREAKER_TIMEOUT', 30)
+
+GEODESIC_DISTANCES = env.bool('GEODESIC_DISTANCES', False)
+
+MENU_CACHE_TIMEOUT = env.int('MENU_CACHE_TIMEOUT', 300)
+
+# Кэш общий для сайта и management-команд: иначе сброс индексов меню
+# из команды не дойдёт до процессов сервера
+CACHES = {
+    'default': env.dj_cache_url(
+        'CACHE_URL',
+        'file://{0}'.format(os.path.join(BASE_DIR, '.cache')),
+    ),
+}
+
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+DELIVERY_ZONE_CHECK = env.str('DELIVERY_ZONE_CHECK', 'off')
+DELIVERY_RADIUS_KM = env.float('DELIVERY_RADIUS_KM', 0)
 
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:////{0}'.format(os.path.join(BASE_DIR, 'db.sqlite3'))
     )
 }
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # База в памяти не ждёт блокировок, а сразу падает с ошибкой,
+    # поэтому тесты параллельных запросов гоняем на файле
+    DATABASES['default']['TEST'] = {
+        'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+    }
 
 AUTH_PASSWORD_VALIDATORS = [
     {